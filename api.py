@@ -0,0 +1,372 @@
+"""
+Read-only HTTP API over the atlas tables, for consumers that want data
+without the dashboard or a database login.
+
+    python api.py --port 8000
+
+    GET /observations?indicator=temp_max_c&region=NG-LAG&start=2024-01-01&end=2024-12-31
+    GET /alerts?indicator=pm25&after=<cursor>
+    GET /ingestion-log?source=CBN&format=csv
+
+Every endpoint takes `limit` (default 1000, max 10000), `after` (the opaque
+`next` cursor from the previous page -- keyset pagination on the table's
+primary key) and `format` = json | csv | arrow (Arrow IPC stream; needs
+pyarrow). Responses are gzip'd when the client accepts it.
+
+Caching is two-level and mostly never touches Postgres:
+
+- Each table's "version" is its change counter in ops.table_versions, which
+  a trigger bumps in every writing transaction (so it moves when the write
+  commits), re-read at most every VERSION_TTL_S seconds. The ETag is a hash
+  of that version plus the normalized query (suffixed `-gzip` for the gzip'd
+  body, since the bytes differ), so a client revalidating with If-None-Match
+  gets a 304 straight from memory until new data lands.
+- Encoded (and pre-gzip'd) response bodies are kept in an in-process LRU
+  keyed the same way; a version bump makes old entries unreachable and they
+  age out.
+"""
+import argparse
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import text
+from sqlalchemy.exc import DataError
+
+# The loaders' modules live in etl/ and import each other flat (they're run as scripts).
+sys.path.insert(0, str(Path(__file__).resolve().parent / "etl"))
+from etl_utils import engine, warm_up  # noqa: E402
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10_000
+# How stale a response can be: a commit shows up in ETags and the cache at
+# most this long after it lands, since versions are only re-read this often.
+VERSION_TTL_S = 30
+CACHE_ENTRIES = 512
+GZIP_LEVEL = 6
+
+# resource -> table, the table whose writes version it (in ops.table_versions;
+# the underlying fact table when `table` is a view), primary key (keyset
+# order), columns returned, the
+# filters it accepts (query param -> SQL predicate), and how `start`/`end`
+# are parsed.
+RESOURCES = {
+    "observations": {
+        "table": "core.observations",
+        "version_table": "core.series_observations",
+        # The fact table's primary key, so pages walk its index instead of sorting the join.
+        "key": ("series_id", "date"),
+        "columns": ("date", "indicator", "region", "source", "value", "meta", "updated_at", "series_id"),
+        "filters": {
+            "indicator": "indicator = :indicator",
+            "region": "region = :region",
+            "source": "source = :source",
+            "start": "date >= CAST(:start AS date)",
+            "end": "date <= CAST(:end AS date)",
+        },
+        "bounds": date,
+    },
+    "alerts": {
+        "table": "core.alerts",
+        "version_table": "core.alerts",
+        "key": ("id",),
+        "columns": ("id", "ts", "signal", "severity", "indicator", "region", "source", "details"),
+        "filters": {
+            "indicator": "indicator = :indicator",
+            "region": "region = :region",
+            "source": "source = :source",
+            "start": "ts >= CAST(:start AS timestamptz)",
+            "end": "ts <= CAST(:end AS timestamptz)",
+        },
+        "bounds": datetime,
+    },
+    "ingestion-log": {
+        "table": "ops.ingestion_log",
+        "version_table": "ops.ingestion_log",
+        "key": ("id",),
+        "columns": ("id", "source", "run_ts", "status", "records", "message", "metrics"),
+        "filters": {
+            "source": "source = :source",
+            "status": "status = :status",
+            "start": "run_ts >= CAST(:start AS timestamptz)",
+            "end": "run_ts <= CAST(:end AS timestamptz)",
+        },
+        "bounds": datetime,
+    },
+}
+FORMATS = {"json": "application/json", "csv": "text/csv; charset=utf-8",
+           "arrow": "application/vnd.apache.arrow.stream"}
+
+
+class BadRequest(Exception):
+    pass
+
+
+# --- versions & cache -------------------------------------------------------
+
+TABLE_VERSION = text("SELECT version FROM ops.table_versions WHERE table_name = :table")
+
+_versions = {}  # resource -> (checked_at, version string)
+_versions_lock = threading.Lock()
+_cache = OrderedDict()  # (resource, query key, format, version) -> response
+_cache_lock = threading.Lock()
+
+
+def table_version(resource: str) -> str:
+    """The resource's committed change counter (ops.table_versions), re-read at most every VERSION_TTL_S."""
+    now = time.monotonic()
+    with _versions_lock:
+        cached = _versions.get(resource)
+    if cached and now - cached[0] < VERSION_TTL_S:
+        return cached[1]
+
+    spec = RESOURCES[resource]
+    with engine.connect() as conn:
+        counter = conn.execute(TABLE_VERSION, {"table": spec["version_table"]}).scalar()
+    version = str(counter) if counter is not None else "empty"
+    with _versions_lock:
+        _versions[resource] = (now, version)
+    return version
+
+
+def _cache_get(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+        return entry
+
+
+def _cache_put(key, entry):
+    with _cache_lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+
+# --- querying & encoding ----------------------------------------------------
+
+def _encode_cursor(values: tuple) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, width: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadRequest("invalid `after` cursor")
+    if not isinstance(values, list) or len(values) != width:
+        raise BadRequest("invalid `after` cursor")
+    return values
+
+
+def parse_query(resource: str, raw_query: str) -> dict:
+    """Validate query params into a canonical dict (also the cache/ETag key)."""
+    spec = RESOURCES[resource]
+    params = {k: v[-1] for k, v in parse_qs(raw_query).items()}
+    unknown = set(params) - set(spec["filters"]) - {"limit", "after", "format"}
+    if unknown:
+        raise BadRequest(f"unknown parameter(s): {', '.join(sorted(unknown))}")
+
+    fmt = params.pop("format", "json")
+    if fmt not in FORMATS:
+        raise BadRequest(f"format must be one of {', '.join(FORMATS)}")
+    try:
+        limit = int(params.pop("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f"limit must be between 1 and {MAX_LIMIT}")
+    after = params.pop("after", None)
+    if after is not None:
+        _decode_cursor(after, len(spec["key"]))
+    for bound in ("start", "end"):
+        if bound in params:
+            try:
+                params[bound] = spec["bounds"].fromisoformat(params[bound]).isoformat()
+            except ValueError:
+                kind = "a date (YYYY-MM-DD)" if spec["bounds"] is date else "an ISO 8601 timestamp"
+                raise BadRequest(f"{bound} must be {kind}")
+
+    return {"filters": dict(sorted(params.items())), "limit": limit, "after": after, "format": fmt}
+
+
+def fetch_page(resource: str, query: dict) -> tuple:
+    """One keyset page: (column names, rows, next cursor or None)."""
+    spec = RESOURCES[resource]
+    key = spec["key"]
+    where = [spec["filters"][name] for name in query["filters"]]
+    bind = dict(query["filters"])
+    if query["after"]:
+        values = _decode_cursor(query["after"], len(key))
+        placeholders = ", ".join(f":after_{i}" for i in range(len(key)))
+        where.append(f"({', '.join(key)}) > ({placeholders})")
+        bind.update({f"after_{i}": v for i, v in enumerate(values)})
+
+    # One extra row tells us whether there's a next page without a count(*).
+    bind["limit"] = query["limit"] + 1
+    sql = (f"SELECT {', '.join(spec['columns'])} FROM {spec['table']}"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + f" ORDER BY {', '.join(key)} LIMIT :limit")
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql), bind).all()
+
+    next_cursor = None
+    if len(rows) > query["limit"]:
+        rows = rows[:query["limit"]]
+        last = rows[-1]._mapping
+        next_cursor = _encode_cursor(tuple(last[k] for k in key))
+    return list(spec["columns"]), rows, next_cursor
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode(fmt: str, columns: list, rows: list, next_cursor) -> bytes:
+    if fmt == "json":
+        body = {"data": [dict(zip(columns, row)) for row in rows], "next": next_cursor}
+        return json.dumps(body, default=_json_default, separators=(",", ":")).encode()
+
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows([_cell(v) for v in row] for row in rows)
+        return out.getvalue().encode()
+
+    if pa is None:
+        raise BadRequest("format=arrow needs pyarrow installed on the server")
+    arrays = {}
+    for i, name in enumerate(columns):
+        values = [row[i] for row in rows]
+        if any(isinstance(v, (dict, list)) for v in values):
+            values = [_cell(v) for v in values]
+        elif any(isinstance(v, Decimal) for v in values):
+            values = [None if v is None else float(v) for v in values]
+        arrays[name] = values
+    table = pa.table(arrays)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+# --- HTTP -------------------------------------------------------------------
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: one TCP connection serves many requests
+    server_version = "LivingDataAtlasAPI/1"
+    # Headers and body go out as separate writes; without TCP_NODELAY every
+    # keep-alive response waits on the client's delayed ACK (~40ms).
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        resource = url.path.strip("/")
+        if resource == "":
+            return self._send(HTTPStatus.OK, "application/json",
+                              json.dumps({"resources": sorted(RESOURCES), "formats": sorted(FORMATS)}).encode())
+        if resource not in RESOURCES:
+            return self._error(HTTPStatus.NOT_FOUND, f"unknown resource: {resource}")
+
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        try:
+            query = parse_query(resource, url.query)
+            version = table_version(resource)
+            canonical = json.dumps(query, sort_keys=True)
+            # Strong ETags are per representation: the gzip'd bytes get their own.
+            digest = hashlib.sha1(f"{resource}|{canonical}|{version}".encode()).hexdigest()[:20]
+            etag = f'"{digest}-gzip"' if use_gzip else f'"{digest}"'
+
+            if etag in (t.strip() for t in self.headers.get("If-None-Match", "").split(",")):
+                return self._send(HTTPStatus.NOT_MODIFIED, None, b"", etag=etag)
+
+            cache_key = (resource, canonical, version)
+            entry = _cache_get(cache_key)
+            if entry is None:
+                columns, rows, next_cursor = fetch_page(resource, query)
+                body = encode(query["format"], columns, rows, next_cursor)
+                entry = {"body": body, "gzip": gzip.compress(body, GZIP_LEVEL), "next": next_cursor}
+                _cache_put(cache_key, entry)
+        except BadRequest as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except DataError as e:
+            # A value Postgres couldn't cast (e.g. in a hand-edited cursor): the request's fault.
+            return self._error(HTTPStatus.BAD_REQUEST, "invalid parameter value: " + str(e.orig).splitlines()[0])
+        except Exception as e:
+            self.log_error("query failed: %s", e)
+            return self._error(HTTPStatus.SERVICE_UNAVAILABLE, "database unavailable, try again shortly")
+
+        extra = {"X-Next-Cursor": entry["next"]} if entry["next"] else {}
+        self._send(HTTPStatus.OK, FORMATS[query["format"]], entry["gzip"] if use_gzip else entry["body"],
+                   etag=etag, gzipped=use_gzip, extra=extra)
+
+    def _send(self, status, content_type, body: bytes, etag=None, gzipped=False, extra=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={VERSION_TTL_S}")
+            self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status, message: str):
+        self._send(status, "application/json", json.dumps({"error": message}).encode())
+
+    def log_message(self, format, *args):
+        # Per-request access logs cost more than serving a cached hit.
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only HTTP API over core.observations/alerts and ops.ingestion_log")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    warm_up()
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -1,10 +1,21 @@
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from charts import bar_chart, line_chart
+
+# The loaders' modules live in etl/ and import each other flat (they're run as scripts).
+sys.path.insert(0, str(Path(__file__).resolve().parent / "etl"))
+import db  # noqa: E402
 
 load_dotenv()
 
@@ -21,6 +32,7 @@ ECON_INDICATORS = {
     "population_total": "Population",
     "poverty_headcount_pct": "Poverty headcount (%)",
     "fx_rate_usd_ngn": "FX rate (NGN per USD)",
+    "gdp_per_capita_usd": "GDP per capita (US$)",
 }
 WEATHER_INDICATORS = ["temp_max_c", "temp_min_c"]
 
@@ -30,13 +42,15 @@ def get_engine():
     db_url = st.secrets.get("DATABASE_URL", os.getenv("DATABASE_URL"))
     if not db_url:
         return None
-    if db_url.startswith("postgresql://"):
-        db_url = db_url.replace("postgresql://", "postgresql+psycopg2://", 1)
-    return create_engine(db_url, pool_pre_ping=True)
+    engine = db.create_pooled_engine(db_url)
+    # Wake a suspended Neon compute while the page layout renders, not on the first chart query.
+    db.warm_up(engine)
+    return engine
 
 
 @st.cache_data(ttl=600)
-def query_observations(indicators: tuple) -> pd.DataFrame:
+def query_observations(indicators: tuple, start=None, end=None) -> pd.DataFrame:
+    """Observations for the given indicators, optionally limited to [start, end]."""
     engine = get_engine()
     if engine is None:
         return pd.DataFrame()
@@ -46,28 +60,90 @@ def query_observations(indicators: tuple) -> pd.DataFrame:
                 SELECT date, indicator, region, value, source
                 FROM core.observations
                 WHERE indicator = ANY(:indicators)
+                  AND (CAST(:start AS date) IS NULL OR date >= :start)
+                  AND (CAST(:end AS date) IS NULL OR date <= :end)
                 ORDER BY date
             """),
             conn,
-            params={"indicators": list(indicators)},
+            params={"indicators": list(indicators), "start": start, "end": end},
         )
 
 
+@st.cache_data(ttl=600)
+def query_date_bounds(indicators: tuple) -> tuple:
+    """(first, last) date on record for the given indicators, or (None, None)."""
+    engine = get_engine()
+    if engine is None:
+        return None, None
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT min(date), max(date) FROM core.observations WHERE indicator = ANY(:indicators)"),
+            {"indicators": list(indicators)},
+        ).one()
+    return row[0], row[1]
+
+
+ALERT_FILTERS = ("indicator", "region", "source")
+ALERTS_PAGE_SIZE = 100
+
+
 @st.cache_data(ttl=300)
-def query_alerts(limit: int = 200) -> pd.DataFrame:
+def query_alert_filter_values(column: str) -> list:
+    """
+    Distinct values of one alert filter column. Walks the column's index one
+    value at a time (a "loose index scan") instead of a DISTINCT over every row.
+    """
+    if column not in ALERT_FILTERS:
+        raise ValueError(f"not an alert filter column: {column}")
+    engine = get_engine()
+    if engine is None:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            WITH RECURSIVE vals AS (
+                (SELECT {column} AS v FROM core.alerts WHERE {column} IS NOT NULL ORDER BY {column} LIMIT 1)
+                UNION ALL
+                SELECT (SELECT {column} FROM core.alerts WHERE {column} > vals.v ORDER BY {column} LIMIT 1)
+                FROM vals WHERE vals.v IS NOT NULL
+            )
+            SELECT v FROM vals WHERE v IS NOT NULL
+        """))
+        return [r[0] for r in rows]
+
+
+@st.cache_data(ttl=300)
+def query_alerts(indicator: str = None, region: str = None, source: str = None,
+                 after: tuple = None, limit: int = ALERTS_PAGE_SIZE) -> pd.DataFrame:
+    """
+    One page of core.alerts, newest first, optionally filtered. `after` is the
+    (ts, id) of the last row on the previous page (keyset pagination), so any
+    page costs the same as the first no matter how deep. Only the fields the
+    Alerts tab shows are pulled out of `details`.
+    """
     engine = get_engine()
     if engine is None:
         return pd.DataFrame()
+    after_ts, after_id = after if after else (None, None)
     with engine.connect() as conn:
         return pd.read_sql(
             text("""
-                SELECT ts, signal, severity, details
+                SELECT id, ts, signal, severity, indicator, region, source,
+                       details->>'date' AS date,
+                       (details->>'value')::numeric AS value,
+                       details->>'expected_range' AS expected_range
                 FROM core.alerts
-                ORDER BY ts DESC
+                WHERE (CAST(:indicator AS text) IS NULL OR indicator = :indicator)
+                  AND (CAST(:region AS text) IS NULL OR region = :region)
+                  AND (CAST(:source AS text) IS NULL OR source = :source)
+                  AND (CAST(:after_ts AS timestamptz) IS NULL OR (ts, id) < (:after_ts, :after_id))
+                ORDER BY ts DESC, id DESC
                 LIMIT :limit
             """),
             conn,
-            params={"limit": limit},
+            params={
+                "indicator": indicator, "region": region, "source": source,
+                "after_ts": after_ts, "after_id": after_id, "limit": limit,
+            },
         )
 
 
@@ -79,7 +155,7 @@ def query_ingestion_log() -> pd.DataFrame:
     with engine.connect() as conn:
         return pd.read_sql(
             text("""
-                SELECT DISTINCT ON (source) source, run_ts, status, records, message
+                SELECT DISTINCT ON (source) source, run_ts, status, records, message, metrics
                 FROM ops.ingestion_log
                 ORDER BY source, run_ts DESC
             """),
@@ -87,26 +163,25 @@ def query_ingestion_log() -> pd.DataFrame:
         )
 
 
+def date_window(indicators: tuple, key: str) -> tuple:
+    """
+    Date-range slider for a long series. Plotly zoom events don't reach
+    Streamlit, so this is the "zoom": narrowing it re-queries just that window,
+    and the chart is re-downsampled at full screen resolution for it.
+    """
+    first, last = query_date_bounds(indicators)
+    if first is None or first == last:
+        return None, None
+    return st.slider("Date range", min_value=first, max_value=last, value=(first, last), key=f"{key}_window")
+
+
 def table_view(df: pd.DataFrame, key: str):
     with st.expander("View as table"):
         st.dataframe(df, use_container_width=True, hide_index=True)
 
 
-st.title("Living Data Atlas")
-st.caption("A continuously updated view of Nigeria's economy, weather, and air quality.")
-
-if get_engine() is None:
-    st.warning(
-        "No DATABASE_URL configured. Set it in `.streamlit/secrets.toml` locally, "
-        "or in the app's Secrets on Streamlit Community Cloud, pointing at your Neon project."
-    )
-    st.stop()
-
-tab_overview, tab_econ, tab_weather, tab_air, tab_markets, tab_alerts, tab_health = st.tabs(
-    ["Overview", "Economy", "Weather", "Air Quality", "Markets", "Alerts", "Pipeline Health"]
-)
-
-with tab_overview:
+@st.fragment
+def overview_tab():
     df_econ_all = query_observations(tuple(ECON_INDICATORS.keys()))
     if df_econ_all.empty:
         st.info("No data yet — run the ETL loaders (see README) to populate the Atlas.")
@@ -121,23 +196,28 @@ with tab_overview:
             else:
                 col.metric(label, f"{row.iloc[0]['value']:,.2f}", help=f"as of {row.iloc[0]['date']}")
 
-with tab_econ:
+
+@st.fragment
+def economy_tab():
     choice = st.selectbox("Indicator", options=list(ECON_INDICATORS.keys()), format_func=lambda c: ECON_INDICATORS[c])
     df = query_observations((choice,))
     if df.empty:
         st.info("No data for this indicator yet.")
     else:
-        fig = px.line(
+        fig = line_chart(
             df, x="date", y="value", color="region",
             color_discrete_sequence=CATEGORICAL,
-            title=ECON_INDICATORS[choice], markers=True,
+            title=ECON_INDICATORS[choice],
         )
         fig.update_layout(yaxis_title=ECON_INDICATORS[choice], xaxis_title=None, hovermode="x unified")
         st.plotly_chart(fig, use_container_width=True)
         table_view(df, "econ")
 
-with tab_weather:
-    df_w = query_observations(tuple(WEATHER_INDICATORS))
+
+@st.fragment
+def weather_tab():
+    w_start, w_end = date_window(tuple(WEATHER_INDICATORS) + ("precip_mm",), "weather")
+    df_w = query_observations(tuple(WEATHER_INDICATORS), w_start, w_end)
     if df_w.empty:
         st.info("No weather data yet.")
     else:
@@ -145,18 +225,18 @@ with tab_weather:
         picked = st.multiselect("Cities", regions, default=regions[:3])
         df_w = df_w[df_w["region"].isin(picked)] if picked else df_w
         df_w["series"] = df_w["region"] + " · " + df_w["indicator"]
-        fig = px.line(
+        fig = line_chart(
             df_w, x="date", y="value", color="series",
             color_discrete_sequence=CATEGORICAL,
-            title="Temperature (°C)", markers=True,
+            title="Temperature (°C)",
         )
         fig.update_layout(yaxis_title="°C", xaxis_title=None, hovermode="x unified")
         st.plotly_chart(fig, use_container_width=True)
 
-        df_p = query_observations(("precip_mm",))
+        df_p = query_observations(("precip_mm",), w_start, w_end)
         df_p = df_p[df_p["region"].isin(picked)] if picked else df_p
         if not df_p.empty:
-            fig2 = px.bar(
+            fig2 = bar_chart(
                 df_p, x="date", y="value", color="region",
                 color_discrete_sequence=CATEGORICAL,
                 title="Precipitation (mm)",
@@ -165,7 +245,9 @@ with tab_weather:
             st.plotly_chart(fig2, use_container_width=True)
         table_view(df_w, "weather")
 
-with tab_air:
+
+@st.fragment
+def air_quality_tab():
     df_a = query_observations(("pm25", "pm10"))
     if df_a.empty:
         st.info("No air quality data yet — OpenAQ coverage in Nigeria is sparse in places.")
@@ -180,44 +262,71 @@ with tab_air:
         st.plotly_chart(fig, use_container_width=True)
         table_view(df_a, "air")
 
-with tab_markets:
-    df_fx = query_observations(("cbn_fx_usd_ngn",))
+
+@st.fragment
+def markets_tab():
+    m_start, m_end = date_window(("cbn_fx_usd_ngn", "ngx_asi"), "markets")
+    df_fx = query_observations(("cbn_fx_usd_ngn",), m_start, m_end)
     if df_fx.empty:
         st.info("No CBN FX rate yet.")
     else:
-        fig = px.line(
+        fig = line_chart(
             df_fx, x="date", y="value",
             color_discrete_sequence=CATEGORICAL,
-            title="CBN official rate (NGN per USD)", markers=True,
+            title="CBN official rate (NGN per USD)",
         )
         fig.update_layout(yaxis_title="NGN per USD", xaxis_title=None, hovermode="x unified")
         st.plotly_chart(fig, use_container_width=True)
         table_view(df_fx, "cbn_fx")
 
-    df_ngx = query_observations(("ngx_asi",))
+    df_ngx = query_observations(("ngx_asi",), m_start, m_end)
     if df_ngx.empty:
         st.info("No NGX All-Share Index data yet.")
     else:
-        fig2 = px.line(
+        fig2 = line_chart(
             df_ngx, x="date", y="value",
             color_discrete_sequence=CATEGORICAL,
-            title="NGX All-Share Index", markers=True,
+            title="NGX All-Share Index",
         )
         fig2.update_layout(yaxis_title="Index value", xaxis_title=None, hovermode="x unified")
         st.plotly_chart(fig2, use_container_width=True)
         table_view(df_ngx, "ngx")
 
-with tab_alerts:
-    alerts = query_alerts()
-    if alerts.empty:
-        st.success("No data-quality alerts raised.")
+
+@st.fragment
+def alerts_tab():
+    filter_cols = st.columns(len(ALERT_FILTERS))
+    filters = {}
+    for col, name in zip(filter_cols, ALERT_FILTERS):
+        picked = col.selectbox(name.capitalize(), ["All"] + query_alert_filter_values(name), key=f"alerts_{name}")
+        filters[name] = None if picked == "All" else picked
+
+    # One cursor per page visited, reset whenever the filters change.
+    if st.session_state.get("alerts_filters") != filters:
+        st.session_state["alerts_filters"] = filters
+        st.session_state["alerts_cursors"] = [None]
+    cursors = st.session_state["alerts_cursors"]
+
+    alerts = query_alerts(**filters, after=cursors[-1])
+    if alerts.empty and len(cursors) == 1:
+        st.success("No data-quality alerts raised." if not any(filters.values()) else "No alerts match these filters.")
     else:
         st.caption("Values loaders flagged as outside a plausible range — check the source, not necessarily wrong.")
-        details = pd.json_normalize(alerts["details"].apply(lambda d: d if isinstance(d, dict) else {}))
-        view = pd.concat([alerts[["ts", "signal", "severity"]].reset_index(drop=True), details], axis=1)
-        st.dataframe(view, use_container_width=True, hide_index=True)
+        st.dataframe(alerts.drop(columns="id"), use_container_width=True, hide_index=True)
+
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("← Newer", disabled=len(cursors) == 1, key="alerts_newer"):
+            cursors.pop()
+            st.rerun(scope="fragment")
+        page_col.caption(f"Page {len(cursors)}")
+        if next_col.button("Older →", disabled=len(alerts) < ALERTS_PAGE_SIZE, key="alerts_older"):
+            last = alerts.iloc[-1]
+            cursors.append((last["ts"].to_pydatetime(), int(last["id"])))
+            st.rerun(scope="fragment")
+
 
-with tab_health:
+@st.fragment
+def pipeline_health_tab():
     log = query_ingestion_log()
     if log.empty:
         st.info("No ingestion runs logged yet.")
@@ -232,3 +341,70 @@ with tab_health:
             )
             if row["message"]:
                 st.caption(row["message"])
+            metrics = row["metrics"] if isinstance(row["metrics"], dict) else {}
+            if metrics.get("resume_ms") is not None:
+                st.caption(
+                    f"DB warm-up {metrics['resume_ms']:,.0f} ms · "
+                    f"{metrics.get('acquires', 0)} checkouts, slowest {metrics.get('acquire_ms_max', 0):,.0f} ms"
+                )
+
+
+# Tab -> fragment that renders it. Only the selected tab's fragment runs on a
+# rerun (st.tabs with on_change="rerun" tracks which one is open), and each
+# fragment reruns on its own when one of its widgets changes, so interaction
+# cost doesn't grow with the number of tabs.
+TABS = {
+    "Overview": overview_tab,
+    "Economy": economy_tab,
+    "Weather": weather_tab,
+    "Air Quality": air_quality_tab,
+    "Markets": markets_tab,
+    "Alerts": alerts_tab,
+    "Pipeline Health": pipeline_health_tab,
+}
+# What the default (first) tab reads, fetched in the background on a session's
+# first load while the page skeleton is drawn.
+PREFETCH = [
+    (query_observations, (tuple(ECON_INDICATORS.keys()),)),
+]
+
+
+@st.cache_resource
+def prefetch_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+def prefetch(loads: list):
+    """
+    Start the given cached queries in the background, each on its own pooled
+    connection. Nothing waits on them here: when the tab calls the same query,
+    st.cache_data's per-key lock hands it the in-flight result.
+    """
+    ctx = get_script_run_ctx()
+
+    def load(fn, args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        fn(*args)
+
+    for fn, args in loads:
+        prefetch_pool().submit(load, fn, args)
+
+
+st.title("Living Data Atlas")
+st.caption("A continuously updated view of Nigeria's economy, weather, and air quality.")
+
+if get_engine() is None:
+    st.warning(
+        "No DATABASE_URL configured. Set it in `.streamlit/secrets.toml` locally, "
+        "or in the app's Secrets on Streamlit Community Cloud, pointing at your Neon project."
+    )
+    st.stop()
+
+if not st.session_state.get("prefetched"):
+    st.session_state["prefetched"] = True
+    prefetch(PREFETCH)
+
+for tab, render in zip(st.tabs(list(TABS), key="tab", on_change="rerun"), TABS.values()):
+    if tab.open:
+        with tab:
+            render()
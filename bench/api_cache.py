@@ -0,0 +1,61 @@
+"""
+Cached-hit throughput of api.py: hammer one already-cached URL over
+keep-alive connections and report requests/second.
+
+    python api.py --port 8000 &
+    python bench/api_cache.py --url "http://127.0.0.1:8000/observations?limit=100" [--etag]
+
+--etag sends If-None-Match with the ETag from a first request, measuring the
+304 path (what a well-behaved polling client hits) instead of full bodies.
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def worker(url, headers, deadline, counts, i):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    n = 0
+    while time.perf_counter() < deadline:
+        conn.request("GET", target, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        n += 1
+    counts[i] = n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--etag", action="store_true")
+    args = parser.parse_args()
+
+    headers = {"Accept-Encoding": "gzip"}
+    parts = urlsplit(args.url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    conn.request("GET", parts.path + (f"?{parts.query}" if parts.query else ""), headers=headers)
+    first = conn.getresponse()
+    first.read()  # also warms the server's cache
+    if args.etag:
+        headers["If-None-Match"] = first.getheader("ETag")
+
+    counts = [0] * args.clients
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=worker, args=(args.url, headers, deadline, counts, i))
+               for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"{sum(counts) / args.seconds:,.0f} req/s over {args.clients} keep-alive clients "
+          f"({'304 revalidation' if args.etag else 'cached 200'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Figure payload benchmark for charts.line_chart vs the old px.line(markers=True).
+
+Builds a synthetic stand-in for the Weather tab -- daily max/min temperature
+for six cities over ten years -- and reports the JSON size Streamlit would ship
+to the browser for each, plus the time to build the figure.
+
+    python bench/chart_payload.py [--years 10]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from charts import line_chart  # noqa: E402
+
+CITIES = ["NG-LAG", "NG-FCT", "NG-KAN", "NG-RIV", "NG-OYO", "NG-ENU"]
+
+
+def synthetic_weather(years: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end="2026-01-01", periods=365 * years, freq="D")
+    season = 3 * np.sin(2 * np.pi * np.arange(len(dates)) / 365.25)
+    frames = []
+    for city in CITIES:
+        for indicator, base in (("temp_max_c", 32), ("temp_min_c", 23)):
+            frames.append(pd.DataFrame({
+                "date": dates,
+                "series": f"{city} · {indicator}",
+                "value": base + season + rng.normal(0, 1.5, len(dates)),
+            }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def measure(build) -> tuple:
+    start = time.perf_counter()
+    fig = build()
+    payload = fig.to_json()
+    return len(payload.encode()), (time.perf_counter() - start) * 1000, len(fig.data[0].x)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    df = synthetic_weather(args.years)
+    before = measure(lambda: px.line(df, x="date", y="value", color="series", markers=True))
+    after = measure(lambda: line_chart(df, x="date", y="value", color="series"))
+
+    print(f"{len(df):,} points across {df['series'].nunique()} series ({args.years} years daily)")
+    print(f"{'':8}{'payload':>12}{'build+json':>14}{'pts/series':>12}")
+    for label, (size, ms, pts) in (("before", before), ("after", after)):
+        print(f"{label:8}{size / 1024:>10,.0f}KB{ms:>12,.0f}ms{pts:>12,}")
+    print(f"payload reduced {before[0] / after[0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Streaming vs whole-document JSON for the World Bank loader.
+
+Serves a synthetic World Bank-shaped payload ([page info, [points]]) gzip'd
+from a local HTTP server, then fetches and normalizes it two ways:
+
+- before: `resp.json()` then walk the full object tree (the old loader);
+- after: `worldbank_loader.fetch_worldbank` + `normalize`, which stream the
+  body through etl_utils.stream_json_array into batched_frame.
+
+Reports wall time and peak Python heap (tracemalloc) for each. Importing
+the loader needs DATABASE_URL (or the local POSTGRES_* vars) set, though no
+connection is made.
+
+    python bench/json_stream.py [--points 200000]
+"""
+import argparse
+import gzip
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+import worldbank_loader  # noqa: E402
+
+
+def synthetic_payload(points: int) -> bytes:
+    data = [
+        {
+            "indicator": {"id": "NY.GDP.MKTP.CD", "value": "GDP (current US$)"},
+            "country": {"id": f"C{i % 250:03d}", "value": f"Country {i % 250}"},
+            "countryiso3code": f"C{i % 250:02d}",
+            "date": str(2024 - i // 250),
+            "value": None if i % 17 == 0 else 1.0e9 + i * 12345.678,
+            "unit": "",
+            "obs_status": "",
+            "decimal": 0,
+        }
+        for i in range(points)
+    ]
+    page = {"page": 1, "pages": 1, "per_page": 20000, "total": points}
+    return gzip.compress(json.dumps([page, data]).encode(), 6)
+
+
+def serve(body: bytes) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def whole_document(url: str) -> pd.DataFrame:
+    resp = worldbank_loader.SESSION.get(url, timeout=30)
+    resp.raise_for_status()
+    payload = resp.json()
+    rows = []
+    for d in payload[1]:
+        if d["value"] is None:
+            continue
+        rows.append({
+            "date": f"{d['date']}-01-01",
+            "indicator": "gdp_usd",
+            "region": d["country"]["id"],
+            "value": float(d["value"]),
+            "meta": {"wb_indicator_code": d["indicator"]["id"]},
+        })
+    return pd.DataFrame(rows)
+
+
+def streamed(url: str) -> pd.DataFrame:
+    return worldbank_loader.normalize(worldbank_loader.fetch_worldbank("NY.GDP.MKTP.CD"), "gdp_usd")
+
+
+def measure(fn) -> tuple:
+    # Timed and traced separately: tracemalloc slows allocation-heavy code a lot.
+    start = time.perf_counter()
+    df = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=200_000)
+    args = parser.parse_args()
+
+    body = synthetic_payload(args.points)
+    server = serve(body)
+    url = f"http://127.0.0.1:{server.server_port}/"
+    worldbank_loader.WORLD_BANK_API = url + "?{country}{indicator}"
+    print(f"{args.points:,} points, {len(body) / 1024:,.0f} KB gzip'd")
+
+    results = {}
+    for label, fn in (("whole document", lambda: whole_document(url)), ("streamed", lambda: streamed(url))):
+        df, elapsed, peak = measure(fn)
+        results[label] = df
+        print(f"  {label:15} {elapsed * 1000:8,.0f} ms   peak heap {peak / 2**20:7,.1f} MB   {len(df):,} rows")
+    pd.testing.assert_frame_equal(results["whole document"], results["streamed"])
+    server.shutdown()
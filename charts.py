@@ -0,0 +1,127 @@
+"""
+Chart helpers for the dashboard: downsample long daily series before they're
+handed to Plotly, and switch to WebGL once a figure is still too big for SVG.
+
+Years of daily weather per city (or the full NGX history) is tens of
+thousands of points, but a chart is ~1000px wide -- anything past that is
+JSON the browser downloads and draws for nothing. Largest-Triangle-Three-
+Buckets keeps the points that matter visually (peaks, troughs, sharp turns)
+where a plain every-Nth-row stride would drop them.
+
+Bars can't be thinned like that (dropping a day's rain changes the total),
+so bar charts sum into weeks, months or years instead.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+# Roughly the plot width in pixels on a wide layout; more points than this per
+# series can't be told apart on screen.
+TARGET_POINTS = 1000
+# Past this many points in a figure, SVG rendering and panning get sluggish.
+WEBGL_THRESHOLD = 2000
+# Markers help on sparse (annual) series and are just noise on dense ones.
+MARKER_THRESHOLD = 200
+# Bars narrower than ~2px stop reading as bars; beyond this many positions on
+# the x axis a bar chart sums into a coarser period.
+TARGET_BARS = 400
+# Pandas period -> how the chart describes it, finest first.
+BAR_PERIODS = {"D": "daily", "W": "weekly", "M": "monthly", "Y": "yearly"}
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of the `n_out` points of (x, y)
+    that best preserve the line's shape. x must be sorted ascending.
+
+    The first and last points are always kept; the rest are split into
+    n_out - 2 equal buckets, and from each bucket we keep the point forming
+    the largest triangle with the previously kept point and the average of
+    the next bucket. Each bucket depends on the previous pick, so buckets are
+    walked in order, but the per-bucket area search is vectorized.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    # Averages of every bucket (plus the last point as a final one-point
+    # bucket) up front, so the sequential walk below only does the area search.
+    starts = np.append(edges[:-1], n - 1)
+    counts = np.diff(np.append(starts, n))
+    avg_x = np.add.reduceat(x, starts) / counts
+    avg_y = np.add.reduceat(y, starts) / counts
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df: pd.DataFrame, x: str = "date", y: str = "value", by: str | None = None,
+               n_out: int = TARGET_POINTS) -> pd.DataFrame:
+    """Reduce each series in df (one per distinct `by` value) to at most n_out points with LTTB."""
+    if df.empty:
+        return df
+
+    def _one(series: pd.DataFrame) -> pd.DataFrame:
+        series = series.dropna(subset=[y]).sort_values(x)
+        if len(series) <= n_out:
+            return series
+        xs = pd.to_datetime(series[x]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        return series.iloc[lttb(xs, series[y].to_numpy(dtype=float), n_out)]
+
+    if by is None:
+        return _one(df).reset_index(drop=True)
+    return pd.concat([_one(g) for _, g in df.groupby(by, sort=False)], ignore_index=True)
+
+
+def line_chart(df: pd.DataFrame, x: str = "date", y: str = "value", color: str | None = None,
+               n_out: int = TARGET_POINTS, **kwargs):
+    """
+    px.line over a downsampled copy of df. Uses WebGL (Scattergl) when the
+    downsampled figure is still large, and only draws markers on sparse series.
+    """
+    plot_df = downsample(df, x=x, y=y, by=color, n_out=n_out)
+    n_series = plot_df[color].nunique() if color else 1
+    return px.line(
+        plot_df, x=x, y=y, color=color,
+        markers=len(plot_df) <= MARKER_THRESHOLD * max(n_series, 1),
+        render_mode="webgl" if len(plot_df) > WEBGL_THRESHOLD else "svg",
+        **kwargs,
+    )
+
+
+def bar_period(dates: pd.Series, n_out: int = TARGET_BARS) -> str:
+    """The finest BAR_PERIODS key that spans `dates` in at most n_out bars."""
+    dates = pd.to_datetime(dates)
+    for period in BAR_PERIODS:
+        if dates.dt.to_period(period).nunique() <= n_out:
+            return period
+    return period
+
+
+def bar_chart(df: pd.DataFrame, x: str = "date", y: str = "value", color: str | None = None,
+              n_out: int = TARGET_BARS, title: str | None = None, **kwargs):
+    """
+    px.bar of `y` summed per day, week, month or year (whichever keeps the
+    chart under n_out bars per series), with the period appended to the
+    title when it isn't daily. Bars sit at the start of their period.
+    """
+    period = bar_period(df[x], n_out) if not df.empty else "D"
+    if period != "D":
+        keys = [pd.to_datetime(df[x]).dt.to_period(period).dt.start_time.rename(x)]
+        if color:
+            keys.append(df[color])
+        df = df.groupby(keys, sort=True)[y].sum(min_count=1).reset_index()
+        if title:
+            title = f"{title}, {BAR_PERIODS[period]} totals"
+    return px.bar(df, x=x, y=y, color=color, title=title, **kwargs)
@@ -4,7 +4,8 @@ from datetime import datetime, timezone
 import pandas as pd
 
 from config import CITIES, OPENAQ_RADIUS_M
-from etl_utils import OPENAQ_API_KEY, http_session, load_observations, log_ingestion
+from etl_utils import (OPENAQ_API_KEY, FetchError, http_session, load_observations, log_ingestion, transaction,
+                       warm_up)
 from quality import flag_out_of_range
 
 BASE_URL = "https://api.openaq.org/v3"
@@ -75,11 +76,19 @@ def normalize_location(location: dict, latest: list, region: str) -> pd.DataFram
     return pd.DataFrame(rows)
 
 
-def run() -> int:
+def run(regions: list = None, strict: bool = False) -> int:
+    """
+    Latest readings for every city, or just `regions` (one work-queue unit).
+    With `strict`, any failed fetch raises FetchError once the rest is loaded.
+    """
+    cities = [c for c in CITIES if regions is None or c["region"] in regions]
+    if regions and not cities:
+        raise ValueError(f"no city configured for region(s) {', '.join(regions)}")
+    warm_up()
     frames = []
     failures = []
 
-    for c in CITIES:
+    for c in cities:
         try:
             locations = fetch_locations(c["lat"], c["lon"])
         except Exception as e:
@@ -95,17 +104,20 @@ def run() -> int:
                 failures.append(f"{c['city']}/{loc.get('name')}: {e}")
 
     df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
-    n = load_observations(df, source=SOURCE)
-    n_alerts = flag_out_of_range(df, source=SOURCE)
-
-    note = f"{len(CITIES)} cities scanned"
-    if n_alerts:
-        note += f"; {n_alerts} quality alerts raised"
-    if failures:
-        log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000])
-    else:
-        log_ingestion(SOURCE, "success", n, note)
-
+    with transaction() as conn:
+        n = load_observations(df, source=SOURCE, conn=conn)
+        n_alerts = flag_out_of_range(df, source=SOURCE, conn=conn)
+
+        note = f"{len(cities)} cities scanned"
+        if n_alerts:
+            note += f"; {n_alerts} quality alerts raised"
+        if failures:
+            log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000], conn=conn)
+        else:
+            log_ingestion(SOURCE, "success", n, note, conn=conn)
+
+    if strict and failures:
+        raise FetchError("; ".join(failures)[:2000])
     return n
 
 
@@ -10,7 +10,7 @@ from datetime import date
 
 import pandas as pd
 
-from etl_utils import http_session, load_observations, log_ingestion
+from etl_utils import FetchError, http_session, load_observations, log_ingestion, transaction, warm_up
 from quality import flag_out_of_range
 
 URL = "https://www.cbn.gov.ng/rates/ExchRateByCurrency.html"
@@ -77,7 +77,9 @@ def normalize(tables: list) -> pd.DataFrame:
     }])
 
 
-def run() -> int:
+def run(strict: bool = False) -> int:
+    """Today's USD/NGN rate; with `strict`, not finding it raises FetchError."""
+    warm_up()
     try:
         tables = fetch_rate_tables()
         df = normalize(tables)
@@ -85,18 +87,22 @@ def run() -> int:
         log_ingestion(SOURCE, "fail", 0, str(e)[:2000])
         raise
 
-    n = load_observations(df, source=SOURCE)
-    n_alerts = flag_out_of_range(df, source=SOURCE)
-
-    if df.empty:
-        log_ingestion(SOURCE, "fail", 0,
-                       "Could not locate a recognizable USD rate row -- CBN page structure may have changed")
-    else:
-        note = "USD/NGN rate loaded"
-        if n_alerts:
-            note += f"; {n_alerts} quality alerts raised"
-        log_ingestion(SOURCE, "success", n, note)
-
+    with transaction() as conn:
+        n = load_observations(df, source=SOURCE, conn=conn)
+        n_alerts = flag_out_of_range(df, source=SOURCE, conn=conn)
+
+        if df.empty:
+            log_ingestion(SOURCE, "fail", 0,
+                           "Could not locate a recognizable USD rate row -- CBN page structure may have changed",
+                           conn=conn)
+        else:
+            note = "USD/NGN rate loaded"
+            if n_alerts:
+                note += f"; {n_alerts} quality alerts raised"
+            log_ingestion(SOURCE, "success", n, note, conn=conn)
+
+    if strict and df.empty:
+        raise FetchError("no recognizable USD rate row on the CBN page")
     return n
 
 
@@ -0,0 +1,188 @@
+"""
+Connection layer shared by the loaders and the dashboard.
+
+Neon scales its compute to zero when idle, and the first connection after
+that pays a cold-resume delay (often a few seconds). Rather than paying it at
+whatever point a loader first happens to touch the database, callers start
+`warm_up()` right away, in the background, while they're still busy with
+HTTP fetching -- by the time rows are ready to load, the compute is awake and
+a pooled connection is waiting.
+
+One tuned engine per process (see `create_pooled_engine`), and acquire/resume
+timings are collected in-process so they can be written alongside each run
+in ops.ingestion_log. `warm_up()` marks the start of a run and resets them,
+so each log row carries that run's timings only (a worker process runs many
+units back to back).
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, Engine
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 5
+POOL_TIMEOUT_S = 30
+# Neon suspends an idle compute after ~5 minutes, which silently kills any
+# pooled connection left open across that boundary. Recycling just under it
+# means we rarely hand out a dead connection; pool_pre_ping catches the rest.
+POOL_RECYCLE_S = 240
+
+# TCP keepalives so a connection stuck on a suspended compute (or dropped by
+# a NAT on the CI runner) is detected in seconds instead of hanging. Only
+# libpq-level params here: Neon's pooled endpoint (PgBouncer, transaction
+# mode) rejects startup `options` like `-c statement_timeout=...`, and
+# psycopg2 never uses server-side prepared statements, so the same settings
+# work against both the direct and the `-pooler` host.
+CONNECT_ARGS = {
+    "connect_timeout": 15,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "application_name": "living-data-atlas",
+}
+
+# How long metrics() will wait for a still-running warm-up to report its
+# round-trip. Longer than that and the resume is logged as unknown; the run
+# itself never waits on it.
+WARM_UP_WAIT_S = 2.0
+
+
+def _fresh_metrics() -> dict:
+    return {
+        "resume_ms": None,
+        "connects": 0,
+        "acquires": 0,
+        "acquire_ms_total": 0.0,
+        "acquire_ms_max": 0.0,
+    }
+
+
+_metrics_lock = threading.Lock()
+_metrics = _fresh_metrics()
+# The current run's warm-up, and a counter bumped by every warm_up() so a
+# ping from an earlier run that finishes late doesn't report into this one.
+_run = {"generation": 0, "warm_up": None}
+_warm_up_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-warm-up")
+
+
+def psycopg2_url(url: str) -> str:
+    """Force the psycopg2 driver on a plain `postgresql://` URL (Neon's dashboard gives those)."""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    return url
+
+
+def local_database_url() -> str | None:
+    """URL of the local docker-compose Postgres from POSTGRES_* in .env, or None if not configured."""
+    db_user = os.getenv("POSTGRES_USER")
+    db_pass = os.getenv("POSTGRES_PASSWORD")
+    db_name = os.getenv("POSTGRES_DB")
+    db_host = os.getenv("POSTGRES_HOST", "localhost")
+    db_port = os.getenv("POSTGRES_PORT", "5433")
+    if not all([db_user, db_pass, db_name]):
+        return None
+    return f"postgresql+psycopg2://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
+
+
+def create_pooled_engine(url: str) -> Engine:
+    """
+    Engine with the pool tuned for a scale-to-zero Postgres: small, LIFO (so
+    surplus connections go idle and get recycled instead of being kept
+    half-alive round-robin), pre-pinged, recycled before Neon's idle suspend.
+    """
+    engine = create_engine(
+        psycopg2_url(url),
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT_S,
+        pool_recycle=POOL_RECYCLE_S,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+        connect_args=CONNECT_ARGS,
+    )
+    event.listen(engine, "connect", _on_connect)
+    return engine
+
+
+def _on_connect(dbapi_conn, connection_record):
+    with _metrics_lock:
+        _metrics["connects"] += 1
+
+
+def _ping(engine: Engine, generation: int) -> float:
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _metrics_lock:
+        if _run["generation"] == generation:
+            _metrics["resume_ms"] = round(elapsed_ms, 1)
+    return elapsed_ms
+
+
+def warm_up(engine: Engine) -> Future:
+    """
+    Start a `SELECT 1` in the background to wake the compute and prime the
+    pool, and reset the timings for the run that's starting. Returns
+    immediately; the future resolves to the round-trip time in ms (i.e. the
+    cold-resume cost, if there was one). Callers don't need to wait on it --
+    a failed warm-up just means the real query pays the resume.
+    """
+    global _metrics
+    with _metrics_lock:
+        _metrics = _fresh_metrics()
+        _run["generation"] += 1
+        future = _warm_up_pool.submit(_ping, engine, _run["generation"])
+        _run["warm_up"] = future
+    return future
+
+
+@contextmanager
+def transaction(engine: Engine):
+    """
+    Check out one connection, time how long that took, and run everything in
+    the block as a single transaction on it (commit on success, rollback on
+    error).
+    """
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _metrics_lock:
+            _metrics["acquires"] += 1
+            _metrics["acquire_ms_total"] += elapsed_ms
+            _metrics["acquire_ms_max"] = max(_metrics["acquire_ms_max"], elapsed_ms)
+        with conn.begin():
+            yield conn
+
+
+@contextmanager
+def reuse_or_begin(engine: Engine, conn: Connection | None = None):
+    """Yield `conn` if the caller already holds one, else open a fresh transaction."""
+    if conn is not None:
+        yield conn
+    else:
+        with transaction(engine) as new_conn:
+            yield new_conn
+
+
+def metrics(wait_s: float = WARM_UP_WAIT_S) -> dict:
+    """
+    Snapshot of the current run's connection timings (since the last
+    warm_up()), rounded for logging. Waits up to `wait_s` for the run's
+    warm-up to finish, so its resume_ms makes it in.
+    """
+    with _metrics_lock:
+        pending = _run["warm_up"]
+    if pending is not None:
+        wait_futures([pending], timeout=wait_s)
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    snapshot["acquire_ms_total"] = round(snapshot["acquire_ms_total"], 1)
+    snapshot["acquire_ms_max"] = round(snapshot["acquire_ms_max"], 1)
+    return snapshot
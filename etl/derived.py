@@ -0,0 +1,230 @@
+"""
+Derived series: indicators computed from other indicators (GDP per capita,
+the CBN vs World Bank FX spread, NGX in USD, weather anomalies) and written
+back into core.observations under source "derived", so the dashboard and the
+API read them like any other series.
+
+Each derived indicator is declared in DERIVED as a vectorized function of a
+per-region frame of its inputs:
+
+- the first input is the primary series -- outputs land on its dates;
+- every other input is joined as-of (its latest value on or before each
+  primary date), which is how an annual World Bank figure lines up against
+  a daily CBN rate;
+- `lookback` is how many earlier primary rows the function needs (1 for a
+  day-over-day return);
+- `climatology` adds a `climatology` column: the region's mean of the
+  primary input for that calendar month, aggregated in SQL.
+
+Runs are incremental. For each derived indicator, ops.derived_state keeps the
+latest input `updated_at` it has already processed. The next run asks which
+(input, region) date ranges changed since then, widens each to the outputs
+those changes can reach (as-of carry-forward, lookback), and recomputes just
+that window. Derived indicators can feed others (ngx_asi_usd ->
+ngx_asi_usd_return_pct); they're processed in dependency order so a chain
+settles in one run.
+"""
+from datetime import timedelta
+from graphlib import TopologicalSorter
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from etl_utils import load_observations, log_ingestion, transaction, warm_up
+
+SOURCE = "derived"
+# Same reasoning as snapshot.INCREMENTAL_OVERLAP: loaders stamp updated_at
+# before commit, so re-check a short overlap; recomputing is idempotent.
+WATERMARK_OVERLAP = timedelta(minutes=15)
+
+DERIVED = {
+    "gdp_per_capita_usd": {
+        "inputs": ["gdp_usd", "population_total"],
+        "fn": lambda f: f["gdp_usd"] / f["population_total"],
+    },
+    "fx_spread_cbn_vs_wb_pct": {
+        "inputs": ["cbn_fx_usd_ngn", "fx_rate_usd_ngn"],
+        "fn": lambda f: (f["cbn_fx_usd_ngn"] / f["fx_rate_usd_ngn"] - 1) * 100,
+    },
+    "ngx_asi_usd": {
+        "inputs": ["ngx_asi", "cbn_fx_usd_ngn"],
+        "fn": lambda f: f["ngx_asi"] / f["cbn_fx_usd_ngn"],
+    },
+    "ngx_asi_usd_return_pct": {
+        "inputs": ["ngx_asi_usd"],
+        "lookback": 1,
+        "fn": lambda f: f["ngx_asi_usd"].pct_change(fill_method=None) * 100,
+    },
+    "temp_max_anomaly_c": {
+        "inputs": ["temp_max_c"],
+        "climatology": True,
+        "fn": lambda f: f["temp_max_c"] - f["climatology"],
+    },
+    "temp_min_anomaly_c": {
+        "inputs": ["temp_min_c"],
+        "climatology": True,
+        "fn": lambda f: f["temp_min_c"] - f["climatology"],
+    },
+}
+
+CHANGED_WINDOWS = text("""
+    SELECT indicator, region, min(date) AS first, max(date) AS last, max(updated_at) AS latest
+    FROM core.observations
+    WHERE indicator = ANY(:inputs)
+      AND (CAST(:since AS timestamptz) IS NULL OR updated_at > :since)
+    GROUP BY indicator, region
+""")
+
+NEXT_DATES = text("""
+    SELECT date FROM core.observations
+    WHERE indicator = :indicator AND region = :region AND date > :after
+    ORDER BY date
+    LIMIT :n
+""")
+
+SERIES_WINDOW = text("""
+    SELECT date, value FROM core.observations
+    WHERE indicator = :indicator AND region = :region
+      AND date >= :lo AND (CAST(:hi AS date) IS NULL OR date <= :hi)
+    UNION ALL
+    (SELECT date, value FROM core.observations
+     WHERE indicator = :indicator AND region = :region AND date < :lo
+     ORDER BY date DESC
+     LIMIT :before)
+    ORDER BY date
+""")
+
+MONTHLY_CLIMATOLOGY = text("""
+    SELECT extract(month FROM date)::int AS month, avg(value)::float AS climatology
+    FROM core.observations
+    WHERE indicator = :indicator AND region = :region
+    GROUP BY 1
+""")
+
+GET_STATE = text("SELECT watermark FROM ops.derived_state WHERE indicator = :indicator")
+SET_STATE = text("""
+    INSERT INTO ops.derived_state (indicator, watermark, updated_at)
+    VALUES (:indicator, :watermark, now())
+    ON CONFLICT (indicator) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()
+""")
+
+
+def dependency_order() -> list:
+    """Derived indicators ordered so each comes after any derived inputs it uses."""
+    graph = {name: [i for i in spec["inputs"] if i in DERIVED] for name, spec in DERIVED.items()}
+    return list(TopologicalSorter(graph).static_order())
+
+
+def affected_window(conn, spec: dict, region: str, changes: dict) -> tuple:
+    """
+    (lo, hi) of primary dates whose output can differ given `changes`
+    ({input: (first, last)} for this region); hi=None means "through the end".
+    """
+    primary = spec["inputs"][0]
+    lo = min(first for first, _ in changes.values())
+    hi = changes[primary][1] if primary in changes else lo
+
+    for indicator, (_, last) in changes.items():
+        if indicator == primary:
+            continue
+        # A changed as-of input carries forward until its next observation.
+        nxt = conn.execute(NEXT_DATES, {"indicator": indicator, "region": region, "after": last, "n": 1}).scalar()
+        if nxt is None:
+            return lo, None
+        hi = max(hi, nxt - timedelta(days=1))
+
+    lookback = spec.get("lookback", 0)
+    if lookback:
+        # Outputs up to `lookback` primary rows past the window read changed rows too.
+        later = conn.execute(NEXT_DATES, {"indicator": primary, "region": region, "after": hi, "n": lookback}).all()
+        if later:
+            hi = later[-1][0]
+    return lo, hi
+
+
+def _series(conn, indicator: str, region: str, lo, hi, before: int) -> pd.DataFrame:
+    rows = conn.execute(SERIES_WINDOW, {
+        "indicator": indicator, "region": region, "lo": lo, "hi": hi, "before": before,
+    }).all()
+    df = pd.DataFrame(rows, columns=["date", indicator])
+    df["date"] = pd.to_datetime(df["date"])
+    df[indicator] = df[indicator].astype(float)
+    return df
+
+
+def compute_window(conn, name: str, region: str, lo, hi) -> pd.DataFrame:
+    """Recompute one derived indicator for one region over primary dates [lo, hi]."""
+    spec = DERIVED[name]
+    primary, *others = spec["inputs"]
+
+    frame = _series(conn, primary, region, lo, hi, before=spec.get("lookback", 0))
+    if frame.empty:
+        return pd.DataFrame()
+    for indicator in others:
+        # One row before lo is enough to as-of fill the start of the window.
+        other = _series(conn, indicator, region, lo, hi, before=1)
+        frame = pd.merge_asof(frame, other, on="date", direction="backward")
+    if spec.get("climatology"):
+        clim = pd.DataFrame(conn.execute(MONTHLY_CLIMATOLOGY, {"indicator": primary, "region": region}).all(),
+                            columns=["month", "climatology"])
+        frame = frame.assign(month=frame["date"].dt.month).merge(clim, on="month", how="left")
+
+    values = spec["fn"](frame).replace([np.inf, -np.inf], np.nan)
+    out = pd.DataFrame({"date": frame["date"].dt.date, "value": values})
+    in_window = (out["date"] >= lo) & ((out["date"] <= hi) if hi is not None else True)
+    out = out[in_window].dropna(subset=["value"])
+    out["indicator"] = name
+    out["region"] = region
+    out["meta"] = [{"inputs": spec["inputs"]}] * len(out)
+    return out
+
+
+def refresh(conn, name: str) -> int:
+    """Bring one derived indicator up to date with its inputs. Returns rows written."""
+    spec = DERIVED[name]
+    watermark = conn.execute(GET_STATE, {"indicator": name}).scalar()
+    since = watermark - WATERMARK_OVERLAP if watermark is not None else None
+    changed = conn.execute(CHANGED_WINDOWS, {"inputs": spec["inputs"], "since": since}).all()
+    if not changed:
+        return 0
+
+    by_region = {}
+    for row in changed:
+        by_region.setdefault(row.region, {})[row.indicator] = (row.first, row.last)
+
+    written = 0
+    for region, changes in by_region.items():
+        lo, hi = affected_window(conn, spec, region, changes)
+        written += load_observations(compute_window(conn, name, region, lo, hi), source=SOURCE, conn=conn)
+
+    latest = max(row.latest for row in changed)
+    conn.execute(SET_STATE, {"indicator": name, "watermark": max(latest, watermark) if watermark else latest})
+    return written
+
+
+def run() -> int:
+    warm_up()
+    counts = {}
+    failures = []
+    for name in dependency_order():
+        try:
+            # Each indicator commits on its own, so a later failure doesn't undo
+            # (or block) the others; its watermark only moves if it succeeded.
+            with transaction() as conn:
+                counts[name] = refresh(conn, name)
+        except Exception as e:
+            failures.append(f"{name}: {e}")
+
+    n = sum(counts.values())
+    note = ", ".join(f"{k} {v}" for k, v in counts.items() if v) or "inputs unchanged"
+    if failures:
+        log_ingestion(SOURCE, "partial" if counts else "fail", n, "; ".join(failures)[:2000])
+    else:
+        log_ingestion(SOURCE, "success", n, note)
+    return n
+
+
+if __name__ == "__main__":
+    count = run()
+    print(f"Derived: {count} rows upserted into core.observations")
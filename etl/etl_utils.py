@@ -1,5 +1,8 @@
+import codecs
 import json
 import os
+import re
+from collections.abc import Iterable, Iterator
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -7,32 +10,34 @@ import pandas as pd
 import requests
 from dotenv import load_dotenv
 from requests.adapters import HTTPAdapter
-from sqlalchemy import create_engine, text
-from urllib3.util import Retry
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from urllib3.util import Retry, make_headers
+
+import db
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(dotenv_path=BASE_DIR / ".env")
 
+
+class FetchError(RuntimeError):
+    """Some of what a loader run was asked to fetch failed (raised by `run(strict=True)`)."""
+
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if DATABASE_URL:
     # Neon (or any Postgres) connection string; force the psycopg2 driver.
-    if DATABASE_URL.startswith("postgresql://"):
-        DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
+    DATABASE_URL = db.psycopg2_url(DATABASE_URL)
 else:
     # Local docker-compose fallback for dev without touching the cloud DB.
-    db_user = os.getenv("POSTGRES_USER")
-    db_pass = os.getenv("POSTGRES_PASSWORD")
-    db_name = os.getenv("POSTGRES_DB")
-    db_host = os.getenv("POSTGRES_HOST", "localhost")
-    db_port = os.getenv("POSTGRES_PORT", "5433")
-    if not all([db_user, db_pass, db_name]):
+    DATABASE_URL = db.local_database_url()
+    if DATABASE_URL is None:
         raise RuntimeError(
             "Set DATABASE_URL (Neon) or POSTGRES_USER/PASSWORD/DB (local dev) in .env"
         )
-    DATABASE_URL = f"postgresql+psycopg2://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = db.create_pooled_engine(DATABASE_URL)
 
 OPENAQ_API_KEY = os.getenv("OPENAQ_API_KEY")
 NGXPULSE_API_KEY = os.getenv("NGXPULSE_API_KEY")
@@ -55,26 +60,307 @@ def http_session() -> requests.Session:
     adapter = HTTPAdapter(max_retries=retry)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
+    # gzip/deflate always; br (and zstd) too when brotli (zstandard) is
+    # installed, since urllib3 can then decode them.
+    session.headers.update(make_headers(accept_encoding=True))
     return session
 
 
+STREAM_CHUNK_BYTES = 64 * 1024
+FRAME_BATCH_ROWS = 5000
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATOR = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class _JsonReader:
+    """
+    Pull-style reader over a stream of JSON bytes. Structure along the way to
+    an array is walked by hand; every value is decoded whole with the stdlib
+    scanner, buffering more input whenever a value runs past what has
+    arrived so far.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.done = False
+
+    def _more(self) -> bool:
+        if self.done:
+            return False
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + self.text.decode(chunk)
+                self.pos = 0
+                return True
+        self.done = True
+        self.buf = self.buf[self.pos:] + self.text.decode(b"", final=True)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, without consuming it."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                raise ValueError("unexpected end of JSON")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} in JSON, found {found!r}")
+        self.pos += 1
+
+    def skip(self, char: str) -> bool:
+        """Consume `char` if it's next."""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        if self.pos >= len(self.buf) or self.buf[self.pos] in " \t\n\r":
+            self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # raw_decode stops a bare number wherever the buffer does ("123." decodes
+            # as 123), so only trust a value once a delimiter or the real end of
+            # input follows it; anything else may be cut at a chunk boundary.
+            follow = _WHITESPACE.match(self.buf, end).end()
+            if follow < len(self.buf):
+                complete = self.buf[follow] in ",]}:"
+            else:
+                complete = self.done
+            if not complete and self._more():
+                continue
+            self.pos = end
+            return obj
+
+    def elements(self) -> Iterator:
+        """Values of the array whose "[" was just consumed, through its "]"."""
+        if self.skip("]"):
+            return
+        while True:
+            yield self.value()
+            # Fast path: the separator is already buffered (almost always).
+            sep = _SEPARATOR.match(self.buf, self.pos)
+            if sep is not None:
+                self.pos = sep.end()
+                if sep.group(1) == "]":
+                    return
+            elif not self.skip(","):
+                self.expect("]")
+                return
+
+
+def iter_json_array(chunks: Iterable[bytes], path: tuple, context: dict | None = None) -> Iterator:
+    """
+    Yield the elements of the JSON array at `path` one at a time, as `chunks`
+    arrive, without materializing the whole document.
+
+    Args:
+        chunks: the response body as an iterable of bytes (UTF-8 JSON).
+        path: keys (objects) / indexes (arrays) leading to the array, e.g.
+            ("history",) or (1,). A missing or null array yields nothing.
+        context: if given, filled with the other values found in the
+            containers along the path (object key or array index -> value).
+            Values after the array are only there once iteration finishes.
+    """
+    reader = _JsonReader(chunks)
+    context = {} if context is None else context
+    open_containers = []  # (closing char, next array index) for each level walked into
+
+    found = True
+    for step in path:
+        if isinstance(step, int):
+            reader.expect("[")
+            index = 0
+            while index < step and not reader.skip("]"):
+                context[index] = reader.value()
+                index += 1
+                reader.skip(",")
+            if index < step or reader.skip("]"):
+                found = False
+                break
+            open_containers.append(("]", index + 1))
+        else:
+            reader.expect("{")
+            while True:
+                if reader.skip("}"):
+                    found = False
+                    break
+                key = reader.value()
+                reader.expect(":")
+                if key == step:
+                    break
+                context[key] = reader.value()
+                reader.skip(",")
+            if not found:
+                break
+            open_containers.append(("}", None))
+
+    if not found:
+        return
+    if reader.peek() == "n":
+        reader.value()  # null instead of an array
+    else:
+        reader.expect("[")
+        yield from reader.elements()
+
+    # Read what follows the array so `context` is complete.
+    for closing, index in reversed(open_containers):
+        while reader.skip(","):
+            if closing == "]":
+                context[index] = reader.value()
+                index += 1
+            else:
+                key = reader.value()
+                reader.expect(":")
+                context[key] = reader.value()
+        reader.expect(closing)
+
+
+def stream_json_array(session: requests.Session, url: str, path: tuple, context: dict | None = None,
+                      **kwargs) -> Iterator:
+    """
+    GET `url` and yield the elements of the JSON array at `path` as the body
+    streams in (decompressed on the fly); see `iter_json_array`. Extra
+    kwargs go to `session.get`.
+    """
+    with session.get(url, stream=True, **kwargs) as resp:
+        resp.raise_for_status()
+        yield from iter_json_array(resp.iter_content(STREAM_CHUNK_BYTES), path, context)
+
+
+def batched_frame(rows: Iterable[dict], batch_rows: int = FRAME_BATCH_ROWS) -> pd.DataFrame:
+    """
+    Build a DataFrame from an iterable of row dicts a batch at a time, so only
+    `batch_rows` dicts are alive at once rather than the whole list.
+    """
+    frames = []
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            frames.append(pd.DataFrame(batch))
+            batch = []
+    if batch:
+        frames.append(pd.DataFrame(batch))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def warm_up():
+    """Start waking the database in the background; call first thing in a loader's run()."""
+    return db.warm_up(engine)
+
+
+def transaction():
+    """One connection/transaction for a loader's load + alerts + log writes."""
+    return db.transaction(engine)
+
+
+# Rows whose value and meta didn't change are left alone, so re-pulling an
+# overlapping window doesn't rewrite them (or bump updated_at for snapshots
+# and derived series to re-read).
 UPSERT_OBSERVATIONS = text("""
-    INSERT INTO core.observations (date, indicator, region, value, source, meta, updated_at)
-    VALUES (:date, :indicator, :region, :value, :source, :meta, :updated_at)
-    ON CONFLICT (date, indicator, region, source) DO UPDATE
+    INSERT INTO core.series_observations (series_id, date, value, meta, updated_at)
+    VALUES (:series_id, :date, :value, :meta, :updated_at)
+    ON CONFLICT (series_id, date) DO UPDATE
     SET value = EXCLUDED.value,
         meta = EXCLUDED.meta,
         updated_at = EXCLUDED.updated_at
+    WHERE (core.series_observations.value, core.series_observations.meta)
+          IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.meta)
 """)
 
+INSERT_SERIES = text("""
+    INSERT INTO core.series (indicator, region, source, meta)
+    VALUES (:indicator, :region, :source, :meta)
+    ON CONFLICT (indicator, region, source) DO NOTHING
+""")
+
+SELECT_SERIES = text("SELECT series_id, indicator, region, source, meta FROM core.series")
+
+# (indicator, region, source) -> (series_id, shared meta). core.series is
+# small and rows are never deleted, so a process loads it once and only goes
+# back to the database for series it hasn't seen.
+_series_cache = {}
+
+
+INSERT_INGESTION_LOG = text("""
+    INSERT INTO ops.ingestion_log (source, status, records, message, metrics)
+    VALUES (:source, :status, :records, :message, :metrics)
+""")
+
+
+def _shared_meta(metas: list) -> dict:
+    """The key/value pairs present, with the same value, in every one of `metas`."""
+    shared = dict(metas[0])
+    for meta in metas[1:]:
+        shared = {k: v for k, v in shared.items() if k in meta and meta[k] == v}
+    return shared
 
-def load_observations(df: pd.DataFrame, source: str) -> int:
+
+def _fetch_series(conn: Connection) -> dict:
+    return {(row.indicator, row.region, row.source): (row.series_id, row.meta or {})
+            for row in conn.execute(SELECT_SERIES)}
+
+
+def resolve_series(keys: dict, source: str) -> dict:
+    """
+    Map (indicator, region) pairs to series ids for `source`, creating any
+    series that don't exist yet.
+
+    Args:
+        keys: (indicator, region) -> list of row meta dicts; for a new series,
+            the meta shared by all of them becomes the series' meta.
+        source: label identifying the loader/API.
+
+    Returns:
+        (indicator, region) -> (series_id, shared meta)
+    """
+    missing = [k for k in keys if (*k, source) not in _series_cache]
+    if missing:
+        # New series are committed on their own so the cache never holds an
+        # id from a load transaction that later rolled back.
+        with db.transaction(engine) as c:
+            if not _series_cache:
+                _series_cache.update(_fetch_series(c))
+                missing = [k for k in missing if (*k, source) not in _series_cache]
+            if missing:
+                rows = []
+                for indicator, region in missing:
+                    shared = _shared_meta(keys[(indicator, region)])
+                    rows.append({"indicator": indicator, "region": region, "source": source,
+                                 "meta": json.dumps(shared) if shared else None})
+                c.execute(INSERT_SERIES, rows)
+                _series_cache.update(_fetch_series(c))
+    return {k: _series_cache[(*k, source)] for k in keys}
+
+
+def load_observations(df: pd.DataFrame, source: str, conn: Connection | None = None) -> int:
     """
     Upsert rows into core.observations, the single fact table every loader writes to.
 
+    Rows are stored against their series (see `resolve_series`), keeping only
+    the meta that differs from what the series shares.
+
     Args:
         df: must contain columns date, indicator, region, value, and optionally meta (dict).
         source: label identifying the loader/API this data came from.
+        conn: an open connection from `transaction()` to write on; if omitted,
+            the upsert runs in its own transaction.
 
     Returns:
         Number of rows upserted.
@@ -82,33 +368,44 @@ def load_observations(df: pd.DataFrame, source: str) -> int:
     if df.empty:
         return 0
 
+    metas = df["meta"].map(lambda m: m or {}) if "meta" in df.columns else pd.Series([{}] * len(df), index=df.index)
+    keys = {}
+    for indicator, region, meta in zip(df["indicator"], df["region"], metas):
+        keys.setdefault((indicator, region), []).append(meta)
+    series = resolve_series(keys, source)
+
     now = datetime.now(timezone.utc)
-    records = [
-        {
-            "date": row["date"],
-            "indicator": row["indicator"],
-            "region": row["region"],
-            "value": None if pd.isna(row["value"]) else float(row["value"]),
-            "source": source,
-            "meta": json.dumps(row.get("meta") or {}),
+    records = []
+    for row_date, indicator, region, value, meta in zip(df["date"], df["indicator"], df["region"], df["value"], metas):
+        series_id, shared = series[(indicator, region)]
+        own = {k: v for k, v in meta.items() if k not in shared or shared[k] != v}
+        records.append({
+            "series_id": series_id,
+            "date": row_date,
+            "value": None if pd.isna(value) else float(value),
+            "meta": json.dumps(own) if own else None,
             "updated_at": now,
-        }
-        for _, row in df.iterrows()
-    ]
+        })
 
-    with engine.begin() as conn:
-        conn.execute(UPSERT_OBSERVATIONS, records)
+    with db.reuse_or_begin(engine, conn) as c:
+        c.execute(UPSERT_OBSERVATIONS, records)
 
     return len(records)
 
 
-def log_ingestion(source: str, status: str, records: int, message: str = ""):
-    """Record the outcome of an ingestion run into ops.ingestion_log."""
-    with engine.begin() as conn:
-        conn.execute(
-            text("""
-                INSERT INTO ops.ingestion_log (source, status, records, message)
-                VALUES (:source, :status, :records, :message)
-            """),
-            {"source": source, "status": status, "records": records, "message": message[:2000]},
+def log_ingestion(source: str, status: str, records: int, message: str = "", conn: Connection | None = None):
+    """
+    Record the outcome of an ingestion run into ops.ingestion_log, along with
+    the run's connection timings (db.metrics(), reset by warm_up()).
+    """
+    with db.reuse_or_begin(engine, conn) as c:
+        c.execute(
+            INSERT_INGESTION_LOG,
+            {
+                "source": source,
+                "status": status,
+                "records": records,
+                "message": message[:2000],
+                "metrics": json.dumps(db.metrics()),
+            },
         )
@@ -0,0 +1,160 @@
+"""
+Gap analysis: which days each series is missing, turned into the smallest
+set of (loader, region, date range) fetches that fills them.
+
+    python etl/gaps.py            # report holes and the fetch plan
+
+Only sources listed in EXPECTED are checked. An entry gives the cadence the
+source should arrive at, how many trailing days upstream may still revise
+(always re-fetched), and the work-queue loader that can fetch a region's date
+range. Weather is the only such loader today; the others either pull their
+full history every run (World Bank, NGX), so a hole heals on the next run
+anyway, or can only see "now" (CBN's page, OpenAQ latest), so there's nothing
+to go back for.
+
+The daily run (worker.daily_units) enqueues this plan instead of re-pulling a
+fixed rolling window, so a hole left by a failed run weeks ago gets filled
+too, and a quiet day fetches only the provisional tail.
+
+Some days upstream simply doesn't have (a station outage Open-Meteo reports
+as null). Once MAX_FETCHES completed work units have covered a settled day
+and it's still missing, it's reported as given up and left out of the plan,
+rather than being re-requested on every run forever.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+import weather_loader
+from config import CITIES
+from etl_utils import transaction
+
+# source -> cadence (Postgres interval between observations), trailing days
+# still subject to revision, the loader that refetches, and the regions that
+# should always have data (so a city with no rows yet still gets fetched).
+EXPECTED = {
+    "Open-Meteo": {
+        # The archive runs a few days behind real time and fills recent days
+        # in late; keep re-pulling the same window the scheduled run always did.
+        "step": "1 day",
+        "provisional_days": weather_loader.ROLLING_WINDOW_DAYS,
+        "loader": "weather",
+        "regions": [c["region"] for c in CITIES],
+    },
+}
+
+# Holes closer together than this are fetched as one range: re-reading a few
+# days we already have costs less than another request (and work unit).
+MERGE_WITHIN = timedelta(days=14)
+
+# A settled day still missing after this many completed fetches that covered
+# it (counted from ops.work_queue) isn't coming; stop asking for it.
+MAX_FETCHES = 3
+
+# Every expected date from a series' first observation up to the start of its
+# provisional tail, minus the dates present; runs of consecutive missing dates
+# ("islands": date minus its rank is constant along a run) collapse to one row.
+# Each missing date also counts the done work units that covered it after it
+# settled; ranking within (series, given up) keeps the two kinds in separate
+# runs.
+MISSING_RANGES = text("""
+    WITH expected AS (
+        SELECT * FROM unnest(CAST(:sources AS text[]), CAST(:steps AS interval[]),
+                             CAST(:provisional AS int[]), CAST(:loaders AS text[]))
+            AS e(source, step, provisional_days, loader)
+    ),
+    spans AS (
+        SELECT s.series_id, s.indicator, s.region, s.source, e.step, e.loader, e.provisional_days,
+               (SELECT min(o.date) FROM core.series_observations o WHERE o.series_id = s.series_id) AS first,
+               CAST(:through AS date) - e.provisional_days AS settled
+        FROM core.series s
+        JOIN expected e USING (source)
+    ),
+    missing AS (
+        SELECT sp.*, d::date AS date,
+               (SELECT count(*) FROM ops.work_queue q
+                WHERE q.loader = sp.loader AND q.region = sp.region AND q.status = 'done'
+                  AND d::date BETWEEN q.start_date AND q.end_date
+                  AND q.finished_at >= d::date + sp.provisional_days) >= :max_fetches AS given_up
+        FROM spans sp
+        CROSS JOIN LATERAL generate_series(sp.first, sp.settled, sp.step) AS d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM core.series_observations o
+            WHERE o.series_id = sp.series_id AND o.date = d::date
+        )
+    ),
+    ranked AS (
+        SELECT *, row_number() OVER (PARTITION BY series_id, given_up ORDER BY date) AS rank
+        FROM missing
+    )
+    SELECT indicator, region, source, given_up, min(date) AS first, max(date) AS last, count(*) AS missing
+    FROM ranked
+    GROUP BY series_id, indicator, region, source, given_up, date - rank * step
+    ORDER BY source, region, indicator, first
+""")
+
+
+def missing_ranges(conn, through: date) -> list:
+    """
+    Runs of missing dates per series, up to each source's provisional tail,
+    flagged `given_up` once MAX_FETCHES completed fetches have missed them.
+    """
+    return conn.execute(MISSING_RANGES, {
+        "sources": list(EXPECTED),
+        "steps": [spec["step"] for spec in EXPECTED.values()],
+        "provisional": [spec["provisional_days"] for spec in EXPECTED.values()],
+        "loaders": [spec["loader"] for spec in EXPECTED.values()],
+        "through": through,
+        "max_fetches": MAX_FETCHES,
+    }).all()
+
+
+def _coalesce(ranges: list) -> list:
+    """Sort and merge (start, end) ranges that overlap or sit within MERGE_WITHIN of each other."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= MERGE_WITHIN:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def fetch_plan(conn, through: date) -> list:
+    """
+    The (loader, region, start, end) fetches that cover every hole not yet
+    given up on, plus each region's provisional tail, merged per (loader,
+    region) since a loader fetches all of a source's indicators for a region
+    together.
+    """
+    wanted = {}
+    for spec in EXPECTED.values():
+        tail = (through - timedelta(days=spec["provisional_days"] - 1), through)
+        for region in spec["regions"]:
+            wanted.setdefault((spec["loader"], region), []).append(tail)
+    for row in missing_ranges(conn, through):
+        if row.given_up:
+            continue
+        spec = EXPECTED[row.source]
+        wanted.setdefault((spec["loader"], row.region), []).append((row.first, row.last))
+
+    return [
+        (loader, region, start, end)
+        for (loader, region), ranges in sorted(wanted.items())
+        for start, end in _coalesce(ranges)
+    ]
+
+
+if __name__ == "__main__":
+    through = date.today() - timedelta(days=1)
+    with transaction() as conn:
+        holes = missing_ranges(conn, through)
+        plan = fetch_plan(conn, through)
+
+    print(f"{len(holes)} hole(s) in tracked series through {through}")
+    for row in holes:
+        note = f"given up after {MAX_FETCHES} fetches" if row.given_up else "missing"
+        print(f"  {row.source:12}{row.region:9}{row.indicator:16}{row.first} .. {row.last}  ({row.missing} {note})")
+    print(f"{len(plan)} fetch(es):")
+    for loader, region, start, end in plan:
+        print(f"  {loader:12}{region:9}{start} .. {end}")
@@ -1,6 +1,9 @@
+from collections.abc import Iterable, Iterator
+
 import pandas as pd
 
-from etl_utils import NGXPULSE_API_KEY, http_session, load_observations, log_ingestion
+from etl_utils import (NGXPULSE_API_KEY, FetchError, batched_frame, http_session, load_observations,
+                       log_ingestion, stream_json_array, transaction, warm_up)
 from quality import flag_out_of_range
 
 BASE_URL = "https://ngxpulse.ng"
@@ -17,53 +20,62 @@ def _headers():
     return {"X-API-Key": NGXPULSE_API_KEY, "Content-Type": "application/json"}
 
 
-def fetch_index_history(code: str) -> dict:
-    """Fetch the full daily history for one NGX index."""
-    r = SESSION.get(f"{BASE_URL}/api/ngxdata/indices/{code}/history", headers=_headers(), timeout=30)
-    r.raise_for_status()
-    return r.json()
+def fetch_index_history(code: str, header: dict) -> Iterator[dict]:
+    """
+    Stream the full daily history for one NGX index, one point at a time.
+    The response's other fields (success, code, name) land in `header`.
+    """
+    return stream_json_array(SESSION, f"{BASE_URL}/api/ngxdata/indices/{code}/history", ("history",),
+                             context=header, headers=_headers(), timeout=30)
 
 
-def normalize(data: dict, indicator_name: str) -> pd.DataFrame:
+def normalize(history: Iterable[dict], header: dict, indicator_name: str) -> pd.DataFrame:
     """Transform NGX Pulse index-history JSON into core.observations rows."""
-    if not data.get("success"):
-        return pd.DataFrame()
-    rows = []
-    for point in data.get("history", []):
-        if point.get("value") is None or not point.get("date"):
-            continue
-        rows.append({
+    rows = (
+        {
             "date": point["date"],
             "indicator": indicator_name,
             "region": "NG",
             "value": float(point["value"]),
-            "meta": {"ngx_index_code": data.get("code"), "ngx_index_name": data.get("name")},
-        })
-    return pd.DataFrame(rows)
+        }
+        for point in history
+        if point.get("value") is not None and point.get("date")
+    )
+    df = batched_frame(rows)
+    # `header` is only complete once the history has been read through.
+    if not header.get("success"):
+        return pd.DataFrame()
+    df["meta"] = [{"ngx_index_code": header.get("code"), "ngx_index_name": header.get("name")}] * len(df)
+    return df
 
 
-def run() -> int:
+def run(strict: bool = False) -> int:
+    """Every index in INDEX_CODES; with `strict`, any failed fetch raises FetchError once the rest is loaded."""
+    warm_up()
     frames = []
     failures = []
     for code, indicator_name in INDEX_CODES.items():
         try:
-            data = fetch_index_history(code)
-            frames.append(normalize(data, indicator_name))
+            header = {}
+            frames.append(normalize(fetch_index_history(code, header), header, indicator_name))
         except Exception as e:
             failures.append(f"{code}: {e}")
 
     df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
-    n = load_observations(df, source=SOURCE)
-    n_alerts = flag_out_of_range(df, source=SOURCE)
-
-    note = f"{len(INDEX_CODES)} indices"
-    if n_alerts:
-        note += f"; {n_alerts} quality alerts raised"
-    if failures:
-        log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000])
-    else:
-        log_ingestion(SOURCE, "success", n, note)
-
+    with transaction() as conn:
+        n = load_observations(df, source=SOURCE, conn=conn)
+        n_alerts = flag_out_of_range(df, source=SOURCE, conn=conn)
+
+        note = f"{len(INDEX_CODES)} indices"
+        if n_alerts:
+            note += f"; {n_alerts} quality alerts raised"
+        if failures:
+            log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000], conn=conn)
+        else:
+            log_ingestion(SOURCE, "success", n, note, conn=conn)
+
+    if strict and failures:
+        raise FetchError("; ".join(failures)[:2000])
     return n
 
 
@@ -3,15 +3,20 @@ import json
 
 import pandas as pd
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 
+import db
 from config import QUALITY_BOUNDS
 from etl_utils import engine
 
+INSERT_ALERT = text("INSERT INTO core.alerts (signal, severity, details) VALUES (:signal, :severity, :details)")
 
-def flag_out_of_range(df: pd.DataFrame, source: str) -> int:
+
+def flag_out_of_range(df: pd.DataFrame, source: str, conn: Connection | None = None) -> int:
     """
     Check df rows (date, indicator, region, value) against QUALITY_BOUNDS and
     write one core.alerts row per violation. Returns the number of alerts raised.
+    Pass `conn` to write in the caller's transaction (see etl_utils.transaction).
     """
     if df.empty:
         return 0
@@ -40,9 +45,6 @@ def flag_out_of_range(df: pd.DataFrame, source: str) -> int:
     if not violations:
         return 0
 
-    with engine.begin() as conn:
-        conn.execute(
-            text("INSERT INTO core.alerts (signal, severity, details) VALUES (:signal, :severity, :details)"),
-            violations,
-        )
+    with db.reuse_or_begin(engine, conn) as c:
+        c.execute(INSERT_ALERT, violations)
     return len(violations)
@@ -0,0 +1,373 @@
+"""
+Fast snapshot/restore of the atlas tables, replacing plain `pg_dump` SQL files.
+
+    python etl/snapshot.py snapshot                # full snapshot of DATABASE_URL
+    python etl/snapshot.py snapshot --incremental  # only rows changed since the last one
+    python etl/snapshot.py restore                 # latest snapshot -> local docker-compose DB
+    python etl/snapshot.py restore snapshot_20260901T030000Z --target-url postgresql://...
+
+A snapshot is a directory under backups/ holding one gzip'd `COPY` file per
+table (binary by default, `--format csv` for something human-readable) plus
+a manifest.json with row counts, SHA-256 checksums and, per table, the
+high-water mark of its change-tracking column. Tables are exported in
+parallel, all from one exported Postgres snapshot so they're consistent with
+each other (the same trick `pg_dump -j` uses).
+
+An incremental snapshot only holds rows whose change column is past the
+previous snapshot's high-water mark, and points at it as its `base`.
+Restoring one replays the chain: the full snapshot is loaded straight into
+empty tables with their indexes and primary keys dropped and rebuilt once at
+the end, then each incremental is upserted on top.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+import db
+
+# Not etl_utils: importing it needs a default database configured, and a
+# restore into an explicit --target-url shouldn't.
+BASE_DIR = Path(__file__).resolve().parent.parent
+BACKUP_DIR = BASE_DIR / "backups"
+SCHEMA_FILE = BASE_DIR / "sql" / "schema.sql"
+MANIFEST = "manifest.json"
+
+# table -> column whose value moves forward whenever a row is written; this is
+# what an incremental snapshot filters on.
+TABLES = {
+    "core.series": "created_at",
+    "core.series_observations": "updated_at",
+    "core.alerts": "ts",
+    "ops.ingestion_log": "run_ts",
+}
+# Loaders stamp updated_at before they commit, so a row can become visible
+# after a snapshot whose high-water mark is already past it. Re-reading a
+# short overlap each time catches those; restore upserts, so repeats are harmless.
+INCREMENTAL_OVERLAP = timedelta(minutes=15)
+COMPRESS_LEVEL = 3  # past ~3 gzip gets much slower for little gain on this data
+READ_CHUNK = 1 << 20
+
+
+class _HashingWriter:
+    """File wrapper that SHA-256s bytes as they're written, so checksums cost no extra read."""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def _bulk_engine(url: str):
+    # One long-lived connection per table worker; pooling buys nothing here.
+    return create_engine(db.psycopg2_url(url), poolclass=NullPool, connect_args=db.CONNECT_ARGS)
+
+
+def _copyable_columns(cur, table: str) -> list:
+    """Columns COPY can round-trip, in order -- generated columns are recomputed on load, not stored."""
+    schema, name = table.split(".")
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (schema, name))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _snapshot_dirs() -> list:
+    return sorted(p for p in BACKUP_DIR.glob("snapshot_*") if (p / MANIFEST).exists())
+
+
+def _read_manifest(path: Path) -> dict:
+    return json.loads((path / MANIFEST).read_text())
+
+
+# --- snapshot ---------------------------------------------------------------
+
+def _export_table(engine, pg_snapshot: str, table: str, prev_watermark, out_dir: Path, fmt: str) -> dict:
+    change_col = TABLES[table]
+    since = prev_watermark - INCREMENTAL_OVERLAP if prev_watermark is not None else None
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cur = raw.cursor()
+        cur.execute("SET TRANSACTION SNAPSHOT %s", (pg_snapshot,))
+        cols = _copyable_columns(cur, table)
+        col_list = ", ".join(cols)
+
+        where = ""
+        params = ()
+        if since is not None:
+            where = f" WHERE {change_col} > %s"
+            params = (since,)
+        cur.execute(f"SELECT max({change_col}) FROM {table}{where}", params)
+        watermark = cur.fetchone()[0]
+
+        query = cur.mogrify(f"SELECT {col_list} FROM {table}{where}", params).decode()
+        options = "FORMAT binary" if fmt == "binary" else "FORMAT csv, HEADER true"
+        filename = f"{table}.{'copy' if fmt == 'binary' else 'csv'}.gz"
+        with open(out_dir / filename, "wb") as f:
+            hashing = _HashingWriter(f)
+            with gzip.GzipFile(fileobj=hashing, mode="wb", compresslevel=COMPRESS_LEVEL) as gz:
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH ({options})", gz)
+            rows = cur.rowcount
+        raw.rollback()
+    finally:
+        raw.close()
+
+    # No new rows (or only overlap re-reads) means the high-water mark doesn't move.
+    high_water = max((w for w in (watermark, prev_watermark) if w is not None), default=None)
+    return {
+        "file": filename,
+        "columns": cols,
+        "rows": rows,
+        "sha256": hashing.sha256.hexdigest(),
+        "change_column": change_col,
+        "since": since.isoformat() if since is not None else None,
+        "watermark": high_water.isoformat() if high_water is not None else None,
+    }
+
+
+def snapshot(url: str, incremental: bool = False, fmt: str = "binary") -> Path:
+    base = None
+    watermarks = {}
+    if incremental:
+        previous = _snapshot_dirs()
+        if not previous:
+            raise SystemExit("No previous snapshot in backups/ to build an incremental on; take a full one first.")
+        base = previous[-1]
+        for table, info in _read_manifest(base)["tables"].items():
+            if info["watermark"]:
+                watermarks[table] = datetime.fromisoformat(info["watermark"])
+
+    started = datetime.now(timezone.utc)
+    out_dir = BACKUP_DIR / f"snapshot_{started:%Y%m%dT%H%M%SZ}"
+    out_dir.mkdir(parents=True)
+
+    engine = _bulk_engine(url)
+    coordinator = engine.raw_connection()
+    t0 = time.perf_counter()
+    try:
+        # Hold a transaction open for the whole export so every worker can
+        # attach to the same point-in-time view.
+        coordinator.driver_connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cur = coordinator.cursor()
+        cur.execute("SELECT pg_export_snapshot()")
+        pg_snapshot = cur.fetchone()[0]
+
+        with ThreadPoolExecutor(max_workers=len(TABLES)) as pool:
+            futures = {
+                table: pool.submit(_export_table, engine, pg_snapshot, table, watermarks.get(table), out_dir, fmt)
+                for table in TABLES
+            }
+            tables = {table: f.result() for table, f in futures.items()}
+    finally:
+        coordinator.rollback()
+        coordinator.close()
+
+    manifest = {
+        "created_at": started.isoformat(),
+        "kind": "incremental" if incremental else "full",
+        "base": base.name if base else None,
+        "format": fmt,
+        "tables": tables,
+    }
+    (out_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    total = sum(t["rows"] for t in tables.values() if t["rows"] and t["rows"] > 0)
+    print(f"{manifest['kind']} snapshot {out_dir.name}: {total:,} rows in {time.perf_counter() - t0:.1f}s")
+    return out_dir
+
+
+# --- restore ----------------------------------------------------------------
+
+def _verify(snap_dir: Path, info: dict):
+    sha = hashlib.sha256()
+    with open(snap_dir / info["file"], "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            sha.update(chunk)
+    if sha.hexdigest() != info["sha256"]:
+        raise SystemExit(f"Checksum mismatch for {snap_dir.name}/{info['file']} -- snapshot is corrupt.")
+
+
+def _copy_in(cur, snap_dir: Path, info: dict, fmt: str, target: str):
+    options = "FORMAT binary" if fmt == "binary" else "FORMAT csv, HEADER true"
+    with gzip.open(snap_dir / info["file"], "rb") as gz:
+        cur.copy_expert(f"COPY {target} ({', '.join(info['columns'])}) FROM STDIN WITH ({options})", gz)
+
+
+def _drop_indexes(cur, table: str) -> list:
+    """Drop the table's primary key and indexes, returning the DDL to recreate them."""
+    schema, name = table.split(".")
+    cur.execute("""
+        SELECT con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        WHERE con.conrelid = %s::regclass AND con.contype = 'p'
+    """, (table,))
+    constraints = cur.fetchall()
+    cur.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = %s AND tablename = %s
+          AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+    """, (schema, name, table))
+    indexes = cur.fetchall()
+
+    for idx_name, _ in indexes:
+        cur.execute(f"DROP INDEX {schema}.{idx_name}")
+    for con_name, _ in constraints:
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {con_name}")
+    return ([f"ALTER TABLE {table} ADD CONSTRAINT {c} {d}" for c, d in constraints]
+            + [d for _, d in indexes])
+
+
+def _reset_sequences(cur, table: str, columns: list):
+    for col in columns:
+        cur.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, col))
+        seq = cur.fetchone()[0]
+        if seq:
+            cur.execute(f"SELECT setval(%s, COALESCE((SELECT max({col}) FROM {table}), 0) + 1, false)", (seq,))
+
+
+def _restore_full(engine, snap_dir: Path, table: str, info: dict, fmt: str):
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("SET maintenance_work_mem = '512MB'")
+        cur.execute(f"TRUNCATE {table}")
+        rebuild = _drop_indexes(cur, table)
+        _copy_in(cur, snap_dir, info, fmt, table)
+        for ddl in rebuild:
+            cur.execute(ddl)
+        _reset_sequences(cur, table, info["columns"])
+        cur.execute(f"ANALYZE {table}")
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def _primary_key(cur, table: str) -> list:
+    cur.execute("""
+        SELECT a.attname FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary
+    """, (table,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def _restore_incremental(engine, snap_dir: Path, table: str, info: dict, fmt: str):
+    if not info["rows"]:
+        return
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cols = info["columns"]
+        col_list = ", ".join(cols)
+        stage = "_snapshot_stage"
+        cur.execute(f"CREATE TEMP TABLE {stage} AS SELECT {col_list} FROM {table} WITH NO DATA")
+        _copy_in(cur, snap_dir, info, fmt, stage)
+
+        pk = _primary_key(cur, table)
+        conflict = ""
+        if pk:
+            updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in cols if c not in pk)
+            conflict = f" ON CONFLICT ({', '.join(pk)}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+        cur.execute(f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM {stage}{conflict}")
+        _reset_sequences(cur, table, cols)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def _chain(name: str | None) -> list:
+    """The snapshot to restore plus every base it depends on, oldest (full) first."""
+    dirs = _snapshot_dirs()
+    if not dirs:
+        raise SystemExit("No snapshots in backups/.")
+    snap = BACKUP_DIR / name if name else dirs[-1]
+    chain = []
+    while snap is not None:
+        if not (snap / MANIFEST).exists():
+            raise SystemExit(f"Snapshot {snap.name} is missing; can't rebuild the chain.")
+        manifest = _read_manifest(snap)
+        chain.append((snap, manifest))
+        snap = BACKUP_DIR / manifest["base"] if manifest["base"] else None
+    return list(reversed(chain))
+
+
+def _apply_schema(engine):
+    # schema.sql is checked in as UTF-16; psycopg2 wants text, so decode whatever it is.
+    raw_sql = SCHEMA_FILE.read_bytes()
+    encoding = "utf-16-le" if raw_sql[1:2] == b"\x00" else "utf-8"
+    sql = raw_sql.decode(encoding).lstrip("\ufeff")
+    raw = engine.raw_connection()
+    try:
+        raw.cursor().execute(sql)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def restore(url: str, name: str | None = None):
+    chain = _chain(name)
+    engine = _bulk_engine(url)
+    t0 = time.perf_counter()
+    _apply_schema(engine)
+
+    for i, (snap_dir, manifest) in enumerate(chain):
+        for info in manifest["tables"].values():
+            _verify(snap_dir, info)
+        step = _restore_full if i == 0 else _restore_incremental
+        with ThreadPoolExecutor(max_workers=len(manifest["tables"])) as pool:
+            futures = [
+                pool.submit(step, engine, snap_dir, table, info, manifest["format"])
+                for table, info in manifest["tables"].items()
+            ]
+            for f in futures:
+                f.result()
+        print(f"  applied {manifest['kind']} {snap_dir.name}")
+
+    print(f"Restored {chain[-1][0].name} ({len(chain)} snapshot(s)) in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    load_dotenv(dotenv_path=BASE_DIR / ".env")
+    parser = argparse.ArgumentParser(description="Parallel COPY snapshots of the atlas database")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_snap = sub.add_parser("snapshot", help="Export tables from DATABASE_URL into backups/")
+    p_snap.add_argument("--incremental", action="store_true",
+                        help="Only rows changed since the most recent snapshot")
+    p_snap.add_argument("--format", choices=["binary", "csv"], default="binary")
+    p_snap.add_argument("--source-url", default=os.getenv("DATABASE_URL") or db.local_database_url(),
+                        help="Defaults to DATABASE_URL, else the docker-compose DB")
+
+    p_restore = sub.add_parser("restore", help="Load a snapshot (and its bases) into a database")
+    p_restore.add_argument("name", nargs="?", help="Snapshot directory name; defaults to the latest")
+    p_restore.add_argument("--target-url", default=db.local_database_url(),
+                           help="Defaults to the docker-compose DB from POSTGRES_* in .env")
+
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        if not args.source_url:
+            sys.exit("No snapshot source: set DATABASE_URL or POSTGRES_USER/PASSWORD/DB in .env, or pass --source-url.")
+        snapshot(args.source_url, incremental=args.incremental, fmt=args.format)
+    else:
+        if not args.target_url:
+            sys.exit("No restore target: set POSTGRES_USER/PASSWORD/DB in .env or pass --target-url.")
+        restore(args.target_url, args.name)
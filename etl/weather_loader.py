@@ -4,7 +4,7 @@ from datetime import date, timedelta
 import pandas as pd
 
 from config import CITIES
-from etl_utils import http_session, load_observations, log_ingestion
+from etl_utils import FetchError, http_session, load_observations, log_ingestion, transaction, warm_up
 from quality import flag_out_of_range
 
 ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
@@ -15,7 +15,8 @@ MAX_CHUNK_DAYS = 31  # keep each request small per the original process-log note
 
 # Open-Meteo's archive has a short reporting lag; pulling the last N days on
 # every run (rather than just "yesterday") means a late-arriving day still
-# gets picked up on the next scheduled run, via upsert.
+# gets picked up on the next run, via upsert. This is the default for running
+# the loader by hand; the scheduled run fetches what etl/gaps.py finds missing.
 ROLLING_WINDOW_DAYS = 10
 
 
@@ -71,36 +72,46 @@ def fetch_weather_range(lat: float, lon: float, start: date, end: date, region:
     return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 
-def run(start: date = None, end: date = None, days_back: int = ROLLING_WINDOW_DAYS) -> int:
+def run(start: date = None, end: date = None, days_back: int = ROLLING_WINDOW_DAYS, regions: list = None,
+        strict: bool = False) -> int:
     """
     Default (no args): rolling window covering the last `days_back` days, for
-    the scheduled daily run. Pass explicit start/end for a one-off backfill.
+    the scheduled daily run. Pass explicit start/end for a one-off backfill,
+    and `regions` to limit the run to those cities (one work-queue unit).
+    With `strict`, any failed fetch raises FetchError once the rest is loaded.
     """
     if end is None:
         end = date.today() - timedelta(days=1)
     if start is None:
         start = end - timedelta(days=days_back)
 
+    cities = [c for c in CITIES if regions is None or c["region"] in regions]
+    if regions and not cities:
+        raise ValueError(f"no city configured for region(s) {', '.join(regions)}")
+    warm_up()
     frames = []
     failures = []
-    for c in CITIES:
+    for c in cities:
         try:
             frames.append(fetch_weather_range(c["lat"], c["lon"], start, end, c["region"]))
         except Exception as e:
             failures.append(f"{c['city']}: {e}")
 
     df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
-    n = load_observations(df, source=SOURCE)
-    n_alerts = flag_out_of_range(df, source=SOURCE)
-
-    note = f"{len(CITIES)} cities, {start} to {end}"
-    if n_alerts:
-        note += f"; {n_alerts} quality alerts raised"
-    if failures:
-        log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000])
-    else:
-        log_ingestion(SOURCE, "success", n, note)
-
+    with transaction() as conn:
+        n = load_observations(df, source=SOURCE, conn=conn)
+        n_alerts = flag_out_of_range(df, source=SOURCE, conn=conn)
+
+        note = f"{len(cities)} cities, {start} to {end}"
+        if n_alerts:
+            note += f"; {n_alerts} quality alerts raised"
+        if failures:
+            log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000], conn=conn)
+        else:
+            log_ingestion(SOURCE, "success", n, note, conn=conn)
+
+    if strict and failures:
+        raise FetchError("; ".join(failures)[:2000])
     return n
 
 
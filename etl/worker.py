@@ -0,0 +1,381 @@
+"""
+Sharded execution: loaders' run() functions as executors for units of work
+pulled from ops.work_queue, so any number of processes or CI runners can
+share one day's (or one backfill's) load.
+
+    python etl/worker.py enqueue --daily                    # the scheduled run's units
+    python etl/worker.py enqueue --loader weather --start 2020-01-01 --end 2024-12-31
+    python etl/worker.py work --processes 4                 # drain the queue locally
+    python etl/worker.py status --batch <id> --fail-on-error
+
+A unit is (loader, region, date range); region/dates are NULL when the loader
+doesn't take them. Workers lease one unit at a time with
+`FOR UPDATE SKIP LOCKED`, so concurrent workers never get the same unit, and
+a unit whose worker died is picked up again once its lease expires.
+
+On top of that, each source has a small number of advisory-lock "slots"
+(SOURCE_CONCURRENCY): a worker must hold one of the source's slots while it
+runs a unit, which caps how many workers hit the same upstream API at once
+no matter how many runners there are. The slot is a transaction-level lock
+held on its own connection, so it also works through Neon's PgBouncer pooler,
+where session-level advisory locks don't.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+import airquality_loader
+import cbn_loader
+import gaps
+import ngx_loader
+import weather_loader
+import worldbank_loader
+from config import CITIES
+from etl_utils import engine, transaction
+
+LEASE = timedelta(minutes=15)
+# A running unit's lease is pushed out this often, so only a dead worker's
+# unit ever expires and gets picked up again.
+HEARTBEAT = LEASE / 3
+MAX_ATTEMPTS = 3
+IDLE_POLL_S = 5
+
+# loader -> executor(region, start, end) returning rows upserted. Loaders run
+# strict, so a failed fetch raises and the unit is retried instead of being
+# marked done with whatever (if anything) did load.
+EXECUTORS = {
+    "worldbank": lambda region, start, end: worldbank_loader.run(country=region or "NG", strict=True),
+    "weather": lambda region, start, end: weather_loader.run(
+        start=start, end=end, regions=[region] if region else None, strict=True),
+    "airquality": lambda region, start, end: airquality_loader.run(
+        regions=[region] if region else None, strict=True),
+    "ngx": lambda region, start, end: ngx_loader.run(strict=True),
+    "cbn": lambda region, start, end: cbn_loader.run(strict=True),
+}
+
+# Loaders whose executor takes a date range; the others pull "latest" or
+# their full history, so a unit for them is just (loader, region).
+DATE_RANGED = {"weather"}
+CITY_LOADERS = {"weather", "airquality"}
+REGIONLESS = {"ngx", "cbn"}
+
+
+# How many workers may run units of one source at the same time. Kept low for
+# APIs with tight free-tier rate limits (OpenAQ) or a single resource (CBN, NGX).
+SOURCE_CONCURRENCY = {
+    "worldbank": 1,
+    "weather": 3,
+    "airquality": 1,
+    "ngx": 1,
+    "cbn": 1,
+}
+LOCK_NAMESPACE = "atlas-source"
+
+# Enqueuing a batch again (e.g. re-running a workflow) leaves finished and
+# in-flight units alone and gives failed ones a fresh set of attempts.
+ENQUEUE_UNIT = text("""
+    INSERT INTO ops.work_queue (batch, loader, region, start_date, end_date)
+    VALUES (:batch, :loader, :region, :start_date, :end_date)
+    ON CONFLICT (batch, loader, region, start_date, end_date) DO UPDATE
+    SET status = 'pending', attempts = 0, leased_by = NULL, lease_expires_at = NULL, message = NULL
+    WHERE ops.work_queue.status = 'failed'
+""")
+
+LEASE_UNIT = text("""
+    UPDATE ops.work_queue q
+    SET status = 'leased',
+        attempts = q.attempts + 1,
+        leased_by = :worker,
+        lease_expires_at = now() + make_interval(secs => :lease_s)
+    WHERE q.id = (
+        SELECT id FROM ops.work_queue
+        WHERE (status = 'pending' OR (status = 'leased' AND lease_expires_at < now()))
+          AND attempts < :max_attempts
+          AND loader <> ALL(:skip_loaders)
+          AND (CAST(:batch AS text) IS NULL OR batch = :batch)
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING q.id, q.loader, q.region, q.start_date, q.end_date, q.attempts
+""")
+
+# Hand a leased unit back untouched (its source had no free slot).
+RELEASE_UNIT = text("""
+    UPDATE ops.work_queue
+    SET status = 'pending', attempts = attempts - 1, leased_by = NULL, lease_expires_at = NULL
+    WHERE id = :id AND leased_by = :worker
+""")
+
+# The leased_by/attempts guard makes a late finish from a worker whose lease
+# already expired (and was re-leased) a no-op instead of clobbering the new run.
+FINISH_UNIT = text("""
+    UPDATE ops.work_queue
+    SET status = :status, finished_at = now(), records = :records, message = :message,
+        lease_expires_at = NULL
+    WHERE id = :id AND leased_by = :worker AND attempts = :attempts
+""")
+
+RENEW_LEASE = text("""
+    UPDATE ops.work_queue
+    SET lease_expires_at = now() + make_interval(secs => :lease_s)
+    WHERE id = :id AND leased_by = :worker AND attempts = :attempts AND status = 'leased'
+""")
+
+TRY_SOURCE_SLOT = text("SELECT pg_try_advisory_xact_lock(hashtext(:namespace), hashtext(:key))")
+
+OPEN_UNITS = text("""
+    SELECT count(*) FROM ops.work_queue
+    WHERE (status = 'pending' OR status = 'leased')
+      AND attempts < :max_attempts
+      AND (CAST(:batch AS text) IS NULL OR batch = :batch)
+""")
+
+
+def daily_units(chunk_days: int) -> list:
+    """
+    The scheduled run, split into one unit per (loader, region). Date-ranged
+    loaders get gaps.fetch_plan -- their holes plus the provisional tail --
+    with long ranges split into chunk_days-long units.
+    """
+    through = date.today() - timedelta(days=1)
+    with transaction() as conn:
+        plan = gaps.fetch_plan(conn, through)
+    units = [("worldbank", "NG", None, None), ("ngx", None, None, None), ("cbn", None, None, None)]
+    for loader, region, start, end in plan:
+        units += backfill_units(loader, start, end, [region], chunk_days)
+    units += [("airquality", c["region"], None, None) for c in CITIES]
+    return units
+
+
+def backfill_units(loader: str, start: date, end: date, regions: list, chunk_days: int) -> list:
+    """A date range for one loader, split per region and into chunk_days-long units."""
+    units = []
+    for region in regions:
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            units.append((loader, region, chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+    return units
+
+
+def unit_regions(loader: str, regions: list | None) -> list:
+    """
+    The regions to enqueue `loader` for: the given ones after checking they
+    mean something to it, else its defaults. World Bank takes country codes
+    (default NG), weather/air quality take city regions, NGX/CBN take none.
+    """
+    if loader in REGIONLESS:
+        if regions:
+            raise ValueError(f"{loader} takes no --region")
+        return [None]
+    if loader in CITY_LOADERS:
+        known = [c["region"] for c in CITIES]
+        unknown = [r for r in regions or [] if r not in known]
+        if unknown:
+            raise ValueError(f"{loader} regions are {', '.join(known)}; got {', '.join(unknown)}")
+        return regions or known
+    bad = [r for r in regions or [] if not (r.isalpha() and len(r) in (2, 3))]
+    if bad:
+        raise ValueError(f"{loader} takes ISO country codes (e.g. NG); got {', '.join(bad)}")
+    return regions or ["NG"]
+
+
+def enqueue(units: list, batch: str) -> int:
+    with transaction() as conn:
+        result = conn.execute(ENQUEUE_UNIT, [
+            {"batch": batch, "loader": loader, "region": region, "start_date": start, "end_date": end}
+            for loader, region, start, end in units
+        ])
+    return result.rowcount
+
+
+def _acquire_slot(loader: str):
+    """
+    Try each of the source's slots; on success return the connection holding
+    it (close it to release), else None.
+    """
+    conn = engine.connect()
+    trans = conn.begin()
+    for slot in range(SOURCE_CONCURRENCY.get(loader, 1)):
+        if conn.execute(TRY_SOURCE_SLOT, {"namespace": LOCK_NAMESPACE, "key": f"{loader}:{slot}"}).scalar():
+            return conn
+    trans.rollback()
+    conn.close()
+    return None
+
+
+@contextmanager
+def _heartbeat(unit, worker_id: str):
+    """Keep renewing `unit`'s lease in the background for as long as the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT.total_seconds()):
+            try:
+                # Straight off the engine, not transaction(): these checkouts
+                # aren't the unit's and shouldn't show in its logged metrics.
+                with engine.begin() as conn:
+                    conn.execute(RENEW_LEASE, {
+                        "id": unit["id"], "worker": worker_id, "attempts": unit["attempts"],
+                        "lease_s": LEASE.total_seconds(),
+                    })
+            except Exception as e:
+                # Try again next beat; the lease still has two beats' slack.
+                print(f"[{worker_id}] lease renewal for #{unit['id']} failed: {e}")
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{unit['id']}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def work(worker_id: str, batch: str = None, wait: bool = False) -> int:
+    """
+    Lease and execute units until the queue (or batch) has nothing left.
+    Returns the number of units this worker completed.
+    """
+    done = 0
+    busy = set()  # sources whose slots were all taken on the last attempt
+    while True:
+        with transaction() as conn:
+            unit = conn.execute(LEASE_UNIT, {
+                "worker": worker_id, "lease_s": LEASE.total_seconds(), "max_attempts": MAX_ATTEMPTS,
+                "skip_loaders": sorted(busy), "batch": batch,
+            }).mappings().first()
+
+        if unit is None:
+            with transaction() as conn:
+                remaining = conn.execute(OPEN_UNITS, {"max_attempts": MAX_ATTEMPTS, "batch": batch}).scalar()
+            if remaining == 0 and not wait:
+                return done
+            # Everything left is leased by someone else or waiting on a busy source.
+            busy.clear()
+            time.sleep(IDLE_POLL_S)
+            continue
+
+        slot_conn = _acquire_slot(unit["loader"])
+        if slot_conn is None:
+            with transaction() as conn:
+                conn.execute(RELEASE_UNIT, {"id": unit["id"], "worker": worker_id})
+            busy.add(unit["loader"])
+            continue
+        busy.clear()
+
+        label = " ".join(str(unit[k]) for k in ("id", "loader", "region", "start_date", "end_date") if unit[k])
+        try:
+            with _heartbeat(unit, worker_id):
+                records = EXECUTORS[unit["loader"]](unit["region"], unit["start_date"], unit["end_date"])
+            status, message = "done", None
+        except Exception as e:
+            records = 0
+            # Back to the queue for another worker unless it's out of attempts.
+            status = "failed" if unit["attempts"] >= MAX_ATTEMPTS else "pending"
+            message = str(e)[:2000]
+        finally:
+            slot_conn.close()
+
+        with transaction() as conn:
+            conn.execute(FINISH_UNIT, {
+                "id": unit["id"], "worker": worker_id, "attempts": unit["attempts"],
+                "status": status, "records": records, "message": message,
+            })
+        print(f"[{worker_id}] #{label}: {status}" + (f" ({message})" if message else f", {records} rows"))
+        if status == "done":
+            done += 1
+
+
+def _work_process(n: int, batch: str, wait: bool):
+    # Forked children must not reuse the parent's pooled connections.
+    engine.dispose(close=False)
+    work(f"{socket.gethostname()}:{os.getpid()}:{n}", batch=batch, wait=wait)
+
+
+def status(batch: str = None) -> list:
+    with transaction() as conn:
+        return conn.execute(text("""
+            SELECT loader, status, count(*) AS units, COALESCE(sum(records), 0) AS records
+            FROM ops.work_queue
+            WHERE CAST(:batch AS text) IS NULL OR batch = :batch
+            GROUP BY loader, status
+            ORDER BY loader, status
+        """), {"batch": batch}).all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded loader runs over ops.work_queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enq = sub.add_parser("enqueue", help="Add units of work to the queue")
+    p_enq.add_argument("--batch", default=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    p_enq.add_argument("--daily", action="store_true",
+                       help="The scheduled run: every loader, per region; date-ranged ones fetch what gaps.py finds")
+    p_enq.add_argument("--loader", choices=sorted(EXECUTORS),
+                       help="One loader: a backfill with --start/--end (weather), else one unit per region")
+    p_enq.add_argument("--start", type=date.fromisoformat)
+    p_enq.add_argument("--end", type=date.fromisoformat)
+    p_enq.add_argument("--region", action="append", help="Limit a backfill to these regions (repeatable)")
+    p_enq.add_argument("--chunk-days", type=int, default=weather_loader.MAX_CHUNK_DAYS * 6)
+
+    p_work = sub.add_parser("work", help="Lease and run units until the queue is empty")
+    p_work.add_argument("--processes", type=int, default=1)
+    p_work.add_argument("--batch", help="Only take units from this batch")
+    p_work.add_argument("--wait", action="store_true", help="Keep polling instead of exiting when idle")
+
+    p_status = sub.add_parser("status", help="Summarize units by loader and status")
+    p_status.add_argument("--batch")
+    p_status.add_argument("--fail-on-error", action="store_true",
+                          help="Exit non-zero if any unit failed or never finished")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        if args.daily:
+            units = daily_units(args.chunk_days)
+        elif args.loader:
+            try:
+                regions = unit_regions(args.loader, args.region)
+            except ValueError as e:
+                sys.exit(str(e))
+            if args.loader in DATE_RANGED:
+                if not (args.start and args.end):
+                    sys.exit(f"--loader {args.loader} needs --start and --end.")
+                units = backfill_units(args.loader, args.start, args.end, regions, args.chunk_days)
+            else:
+                if args.start or args.end:
+                    sys.exit(f"{args.loader} doesn't take a date range; it pulls latest/full history every run.")
+                units = [(args.loader, region, None, None) for region in regions]
+        else:
+            sys.exit("Pass --daily, or --loader (with --start and --end for a date-ranged loader).")
+        print(f"Batch {args.batch}: {enqueue(units, args.batch)} of {len(units)} units enqueued")
+
+    elif args.command == "work":
+        if args.processes == 1:
+            _work_process(0, args.batch, args.wait)
+        else:
+            procs = [multiprocessing.Process(target=_work_process, args=(n, args.batch, args.wait))
+                     for n in range(args.processes)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+
+    else:
+        rows = status(args.batch)
+        print(f"{'loader':12}{'status':10}{'units':>7}{'records':>10}")
+        for row in rows:
+            print(f"{row.loader:12}{row.status:10}{row.units:>7}{row.records:>10}")
+        if args.fail_on_error and any(row.status != "done" for row in rows):
+            sys.exit(1)
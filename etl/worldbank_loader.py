@@ -1,7 +1,10 @@
+from collections.abc import Iterable, Iterator
+
 import pandas as pd
 
 from config import WORLDBANK_INDICATORS
-from etl_utils import http_session, load_observations, log_ingestion
+from etl_utils import (FetchError, batched_frame, http_session, load_observations, log_ingestion, stream_json_array,
+                       transaction, warm_up)
 from quality import flag_out_of_range
 
 WORLD_BANK_API = "https://api.worldbank.org/v2/country/{country}/indicator/{indicator}?format=json&per_page=20000"
@@ -9,34 +12,40 @@ SOURCE = "World Bank"
 SESSION = http_session()
 
 
-def fetch_worldbank(indicator: str, country: str = "NG") -> list:
-    """Fetch raw indicator data directly from the World Bank API."""
+def fetch_worldbank(indicator: str, country: str = "NG") -> Iterator[dict]:
+    """
+    Stream raw indicator data directly from the World Bank API. The payload is
+    [page info, [data points]]; points are yielded as they're parsed. An
+    unknown country/indicator comes back as [{"message": [...]}] with a 200,
+    which raises once the body is read.
+    """
     url = WORLD_BANK_API.format(country=country, indicator=indicator)
-    resp = SESSION.get(url, timeout=30)
-    resp.raise_for_status()
-    payload = resp.json()
-    if len(payload) < 2 or payload[1] is None:
-        return []
-    return payload[1]
+    header = {}
+    yield from stream_json_array(SESSION, url, (1,), context=header, timeout=30)
+    if isinstance(header.get(0), dict) and "message" in header[0]:
+        details = "; ".join(str(m.get("value", m)) for m in header[0]["message"])
+        raise RuntimeError(f"World Bank API rejected {country}/{indicator}: {details}")
 
 
-def normalize(data: list, indicator_name: str) -> pd.DataFrame:
+def normalize(data: Iterable[dict], indicator_name: str) -> pd.DataFrame:
     """Transform raw World Bank JSON into core.observations rows (one per year)."""
-    rows = []
-    for d in data:
-        if d["value"] is None:
-            continue
-        rows.append({
+    rows = (
+        {
             "date": f"{d['date']}-01-01",
             "indicator": indicator_name,
             "region": d["country"]["id"],
             "value": float(d["value"]),
             "meta": {"wb_indicator_code": d["indicator"]["id"]},
-        })
-    return pd.DataFrame(rows)
+        }
+        for d in data
+        if d["value"] is not None
+    )
+    return batched_frame(rows)
 
 
-def run(country: str = "NG") -> int:
+def run(country: str = "NG", strict: bool = False) -> int:
+    """All indicators for `country`; with `strict`, any failed fetch raises FetchError once the rest is loaded."""
+    warm_up()
     frames = []
     failures = []
     for wb_code, indicator_name in WORLDBANK_INDICATORS.items():
@@ -47,17 +56,20 @@ def run(country: str = "NG") -> int:
             failures.append(f"{wb_code}: {e}")
 
     df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
-    n = load_observations(df, source=SOURCE)
-    n_alerts = flag_out_of_range(df, source=SOURCE)
+    with transaction() as conn:
+        n = load_observations(df, source=SOURCE, conn=conn)
+        n_alerts = flag_out_of_range(df, source=SOURCE, conn=conn)
 
-    note = f"{len(WORLDBANK_INDICATORS)} indicators loaded"
-    if n_alerts:
-        note += f"; {n_alerts} quality alerts raised"
-    if failures:
-        log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000])
-    else:
-        log_ingestion(SOURCE, "success", n, note)
+        note = f"{len(WORLDBANK_INDICATORS)} indicators loaded"
+        if n_alerts:
+            note += f"; {n_alerts} quality alerts raised"
+        if failures:
+            log_ingestion(SOURCE, "partial" if n else "fail", n, "; ".join(failures)[:2000], conn=conn)
+        else:
+            log_ingestion(SOURCE, "success", n, note, conn=conn)
 
+    if strict and failures:
+        raise FetchError("; ".join(failures)[:2000])
     return n
 
 
@@ -0,0 +1,66 @@
+"""
+etl_utils.iter_json_array must give the same result wherever the network
+happens to split the body, so every test here feeds the document cut at
+every byte offset (and one byte at a time).
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+# etl_utils builds its (lazy, never connected) engine at import time.
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+from etl_utils import iter_json_array  # noqa: E402
+
+DOCS = [
+    ({"success": True, "count": 123.45, "history": [1.5, 2.25, {"date": "2024-01-02", "value": 1e-3}], "name": "ASI"},
+     ("history",)),
+    ([{"page": 1, "pages": 1}, [{"date": "2020", "value": 12.5e3, "country": {"id": "NG", "value": "Nigéria"}},
+                                {"date": "2019", "value": None}]],
+     (1,)),
+    ([{"message": [{"id": "120"}]}], (1,)),
+    ([{"page": 1}, None], (1,)),
+    ({"success": False, "error": "bad key", "n": -7}, ("history",)),
+    ([10, -2.5, 3e2, True, False, None, "x"], ()),
+]
+
+
+def _expected(doc, path):
+    context = {}
+    node = doc
+    for step in path:
+        siblings = node.items() if isinstance(node, dict) else enumerate(node)
+        context.update((k, v) for k, v in siblings if k != step)
+        try:
+            node = node[step]
+        except (IndexError, KeyError):
+            return [], context
+    return node or [], context
+
+
+@pytest.mark.parametrize("doc,path", DOCS)
+@pytest.mark.parametrize("indent", [None, 1])
+def test_every_split_point(doc, path, indent):
+    raw = json.dumps(doc, ensure_ascii=False, indent=indent).encode()
+    items, context = _expected(doc, path)
+    for cut in range(len(raw) + 1):
+        got_context = {}
+        assert list(iter_json_array([raw[:cut], raw[cut:]], path, got_context)) == items, cut
+        assert got_context == context, cut
+
+
+@pytest.mark.parametrize("doc,path", DOCS)
+def test_one_byte_chunks(doc, path):
+    raw = json.dumps(doc, ensure_ascii=False).encode()
+    items, context = _expected(doc, path)
+    got_context = {}
+    assert list(iter_json_array((raw[i:i + 1] for i in range(len(raw))), path, got_context)) == items
+    assert got_context == context
+
+
+def test_truncated_document_raises():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"history": [1, 2'], ("history",)))